@@ -28,6 +28,7 @@ CREATE TABLE Transactions (
     amount NUMERIC(12, 2) NOT NULL CHECK (amount > 0),
     currency VARCHAR(3) NOT NULL,
     is_deleted BOOLEAN NOT NULL DEFAULT FALSE, -- This flag marks a transaction as "deleted".
+    pending_id VARCHAR(32) UNIQUE, -- ID given by the bot's write buffer, a repeated insert of the row is skipped.
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
@@ -58,5 +59,11 @@ CREATE INDEX idx_transactions_user_date ON Transactions(user_id, date);
 -- Add a filter to this index to optimize queries for active transactions, a very common operation.
 CREATE INDEX idx_active_transactions ON Transactions(user_id, date) WHERE is_deleted = FALSE;
 CREATE INDEX idx_transactions_category_id ON Transactions(category_id);
+-- Latest change of a user's transactions (cache version check of the dashboard).
+CREATE INDEX idx_transactions_user_updated_at ON Transactions(user_id, updated_at);
 CREATE INDEX idx_categories_user_id ON Categories(user_id);
-CREATE INDEX idx_transaction_history_transaction_id ON Transaction_History(transaction_id);
\ No newline at end of file
+CREATE INDEX idx_transaction_history_transaction_id ON Transaction_History(transaction_id);
+
+-- Existing databases: add the write buffer's idempotency key.
+-- ALTER TABLE Transactions ADD COLUMN IF NOT EXISTS pending_id VARCHAR(32);
+-- ALTER TABLE Transactions ADD CONSTRAINT transactions_pending_id_key UNIQUE (pending_id);
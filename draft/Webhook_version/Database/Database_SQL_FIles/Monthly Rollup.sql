@@ -0,0 +1,241 @@
+-- =============================================================================
+-- ** MONTHLY ROLLUP (called by supabase_api.get_monthly_summary / rollup_tool.py)
+-- =============================================================================
+
+-- Monthly totals of the active transactions of each user, per category and currency.
+-- Maintained row by row by the triggers below, so a monthly summary reads one row per
+-- category instead of every transaction of the month.
+CREATE TABLE IF NOT EXISTS Monthly_Category_Totals (
+    user_id BIGINT NOT NULL,
+    month DATE NOT NULL, -- First day of the month
+    category_id INTEGER NOT NULL,
+    currency VARCHAR(3) NOT NULL,
+    total_amount NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, month, category_id, currency),
+    FOREIGN KEY (user_id) REFERENCES Users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (category_id) REFERENCES Categories(category_id) ON DELETE CASCADE
+);
+
+
+-- =============================================================================
+-- SECTION 1: INCREMENTAL MAINTENANCE
+-- =============================================================================
+
+--
+-- FUNCTION: apply_monthly_rollup_delta()
+-- PURPOSE:  Adds an amount / count delta to one rollup row (creates the row if needed).
+--           A row whose count drops to 0 is removed.
+--
+CREATE OR REPLACE FUNCTION apply_monthly_rollup_delta(
+    p_user_id BIGINT,
+    p_date DATE,
+    p_category_id INTEGER,
+    p_currency VARCHAR(3),
+    p_amount NUMERIC,
+    p_count INTEGER
+)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO Monthly_Category_Totals AS m (
+        user_id,
+        month,
+        category_id,
+        currency,
+        total_amount,
+        transaction_count
+    ) VALUES (
+        p_user_id,
+        date_trunc('month', p_date)::DATE,
+        p_category_id,
+        p_currency,
+        p_amount,
+        p_count
+    )
+    ON CONFLICT (user_id, month, category_id, currency) DO UPDATE
+    SET total_amount = m.total_amount + EXCLUDED.total_amount,
+        transaction_count = m.transaction_count + EXCLUDED.transaction_count,
+        updated_at = NOW();
+
+    DELETE FROM Monthly_Category_Totals
+    WHERE user_id = p_user_id
+      AND month = date_trunc('month', p_date)::DATE
+      AND category_id = p_category_id
+      AND currency = p_currency
+      AND transaction_count <= 0;
+END;
+$$ LANGUAGE plpgsql;
+
+
+--
+-- FUNCTION: maintain_monthly_rollup()
+-- PURPOSE:  Keeps Monthly_Category_Totals in step with Transactions.
+--           INSERT adds the new row; UPDATE removes the old state and adds the new one,
+--           so a soft delete (is_deleted FALSE -> TRUE) only removes it.
+--
+CREATE OR REPLACE FUNCTION maintain_monthly_rollup()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.is_deleted = FALSE THEN
+        PERFORM apply_monthly_rollup_delta(OLD.user_id, OLD.date, OLD.category_id, OLD.currency, -OLD.amount, -1);
+    END IF;
+
+    IF NEW.is_deleted = FALSE THEN
+        PERFORM apply_monthly_rollup_delta(NEW.user_id, NEW.date, NEW.category_id, NEW.currency, NEW.amount, 1);
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- =============================================================================
+-- SECTION 2: REBUILD AND VERIFY
+-- =============================================================================
+
+--
+-- FUNCTION: verify_monthly_rollup()
+-- PURPOSE:  Compares the rollup with totals recomputed from Transactions and returns
+--           the rows that differ (all users if p_user_id is NULL). No rows = consistent.
+--
+CREATE OR REPLACE FUNCTION verify_monthly_rollup(p_user_id BIGINT DEFAULT NULL)
+RETURNS TABLE (
+    user_id BIGINT,
+    month DATE,
+    category_id INTEGER,
+    currency VARCHAR(3),
+    rollup_amount NUMERIC,
+    actual_amount NUMERIC,
+    rollup_count INTEGER,
+    actual_count INTEGER
+) AS $$
+    WITH actual AS (
+        SELECT
+            t.user_id,
+            date_trunc('month', t.date)::DATE AS month,
+            t.category_id,
+            t.currency,
+            SUM(t.amount) AS total_amount,
+            COUNT(*)::INTEGER AS transaction_count
+        FROM Transactions t
+        WHERE t.is_deleted = FALSE
+          AND (p_user_id IS NULL OR t.user_id = p_user_id)
+        GROUP BY 1, 2, 3, 4
+    ),
+    rollup AS (
+        SELECT m.user_id, m.month, m.category_id, m.currency, m.total_amount, m.transaction_count
+        FROM Monthly_Category_Totals m
+        WHERE p_user_id IS NULL OR m.user_id = p_user_id
+    )
+    SELECT
+        COALESCE(r.user_id, a.user_id),
+        COALESCE(r.month, a.month),
+        COALESCE(r.category_id, a.category_id),
+        COALESCE(r.currency, a.currency),
+        r.total_amount,
+        a.total_amount,
+        r.transaction_count,
+        a.transaction_count
+    FROM rollup r
+    FULL OUTER JOIN actual a
+        ON a.user_id = r.user_id
+       AND a.month = r.month
+       AND a.category_id = r.category_id
+       AND a.currency = r.currency
+    WHERE r.total_amount IS DISTINCT FROM a.total_amount
+       OR r.transaction_count IS DISTINCT FROM a.transaction_count;
+$$ LANGUAGE sql STABLE;
+
+
+--
+-- FUNCTION: rebuild_monthly_rollup()
+-- PURPOSE:  Recomputes the rollup from Transactions (all users if p_user_id is NULL)
+--           and returns the number of rollup rows written.
+--
+CREATE OR REPLACE FUNCTION rebuild_monthly_rollup(p_user_id BIGINT DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+    v_rows INTEGER;
+BEGIN
+    -- Blocks concurrent transaction writes so no delta is lost during the rebuild
+    LOCK TABLE Transactions IN SHARE MODE;
+
+    DELETE FROM Monthly_Category_Totals
+    WHERE p_user_id IS NULL OR user_id = p_user_id;
+
+    INSERT INTO Monthly_Category_Totals (user_id, month, category_id, currency, total_amount, transaction_count)
+    SELECT
+        user_id,
+        date_trunc('month', date)::DATE,
+        category_id,
+        currency,
+        SUM(amount),
+        COUNT(*)
+    FROM Transactions
+    WHERE is_deleted = FALSE
+      AND (p_user_id IS NULL OR user_id = p_user_id)
+    GROUP BY 1, 2, 3, 4;
+
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- =============================================================================
+-- SECTION 3: SUMMARY READ
+-- =============================================================================
+
+--
+-- FUNCTION: get_monthly_summary()
+-- PURPOSE:  Returns the totals of one month of a user from the rollup, one row per
+--           category and currency (no scan of Transactions).
+--
+-- RETURNS:  {
+--             "month":           "2025-07-01",
+--             "category_totals": [{"category_type", "category_name", "currency", "amount", "count"}, ...],
+--             "type_totals":     [{"category_type", "currency", "amount", "count"}, ...]
+--           }
+--
+CREATE OR REPLACE FUNCTION get_monthly_summary(p_user_id BIGINT, p_month DATE)
+RETURNS JSONB AS $$
+    WITH per_category AS (
+        SELECT
+            c.category_type,
+            c.category_name,
+            m.currency,
+            m.total_amount AS amount,
+            m.transaction_count AS count
+        FROM Monthly_Category_Totals m
+        JOIN Categories c ON c.category_id = m.category_id
+        WHERE m.user_id = p_user_id
+          AND m.month = date_trunc('month', p_month)::DATE
+    ),
+    per_type AS (
+        SELECT category_type, currency, SUM(amount) AS amount, SUM(count) AS count
+        FROM per_category
+        GROUP BY category_type, currency
+    )
+    SELECT jsonb_build_object(
+        'month', date_trunc('month', p_month)::DATE,
+        'category_totals', COALESCE((SELECT jsonb_agg(to_jsonb(per_category) ORDER BY amount DESC) FROM per_category), '[]'::jsonb),
+        'type_totals', COALESCE((SELECT jsonb_agg(to_jsonb(per_type)) FROM per_type), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
+
+
+-- =============================================================================
+-- SECTION 4: TRIGGER DEFINITION
+-- =============================================================================
+
+DROP TRIGGER IF EXISTS after_transaction_rollup ON Transactions;
+
+-- Runs after before_transaction_update, which rejects changes to deleted transactions
+CREATE TRIGGER after_transaction_rollup
+AFTER INSERT OR UPDATE ON Transactions
+FOR EACH ROW
+EXECUTE FUNCTION maintain_monthly_rollup();
+
+-- Fill the rollup with the existing transactions
+SELECT rebuild_monthly_rollup();
@@ -0,0 +1,56 @@
+-- =============================================================================
+-- ** TRANSACTION SUMMARY (called by supabase_api.get_transaction_summary)
+-- =============================================================================
+
+--
+-- FUNCTION: get_transaction_summary()
+-- PURPOSE:  Aggregates the active transactions of a user in a date range on the
+--           database, so that clients read a few summary rows instead of every
+--           transaction. Uses idx_active_transactions (user_id, date).
+--
+-- RETURNS:  {
+--             "daily_totals":    [{"date", "category_type", "currency", "amount", "count"}, ...],
+--             "category_totals": [{"category_type", "category_name", "currency", "amount", "count"}, ...],
+--             "type_totals":     [{"category_type", "currency", "amount", "count"}, ...]
+--           }
+--
+CREATE OR REPLACE FUNCTION get_transaction_summary(
+    p_user_id BIGINT,
+    p_start_date DATE,
+    p_end_date DATE
+)
+RETURNS JSONB AS $$
+    WITH filtered AS (
+        SELECT
+            t.date,
+            t.amount,
+            t.currency,
+            c.category_type,
+            c.category_name
+        FROM Transactions t
+        JOIN Categories c ON c.category_id = t.category_id
+        WHERE t.user_id = p_user_id
+          AND t.is_deleted = FALSE
+          AND t.date BETWEEN p_start_date AND p_end_date
+    ),
+    daily AS (
+        SELECT date, category_type, currency, SUM(amount) AS amount, COUNT(*) AS count
+        FROM filtered
+        GROUP BY date, category_type, currency
+    ),
+    per_category AS (
+        SELECT category_type, category_name, currency, SUM(amount) AS amount, COUNT(*) AS count
+        FROM filtered
+        GROUP BY category_type, category_name, currency
+    ),
+    per_type AS (
+        SELECT category_type, currency, SUM(amount) AS amount, COUNT(*) AS count
+        FROM filtered
+        GROUP BY category_type, currency
+    )
+    SELECT jsonb_build_object(
+        'daily_totals', COALESCE((SELECT jsonb_agg(to_jsonb(daily) ORDER BY date) FROM daily), '[]'::jsonb),
+        'category_totals', COALESCE((SELECT jsonb_agg(to_jsonb(per_category) ORDER BY amount DESC) FROM per_category), '[]'::jsonb),
+        'type_totals', COALESCE((SELECT jsonb_agg(to_jsonb(per_type)) FROM per_type), '[]'::jsonb)
+    );
+$$ LANGUAGE sql STABLE;
@@ -1,11 +1,16 @@
-from llm_tools import TransactionExtractorLLM
+from transaction_service import parse_transaction, parse_transactions_batch, TransactionParseError, extraction_cache, fast_path_extractor, transaction_write_buffer
 from telegram_api import *
 from supabase_api import *
 from utils import *
-from command_manager import CommandManager
-from callback_manager import CallbackManager
+from command_manager import command_exec
+from callback_manager import callback_exec
+from update_queue import ShardedUpdateDispatcher, UpdateDeduplicator, SharedUpdateDeduplicator
+from session_store import SessionStore
+from conversation import conversation_states
+from session_backends import create_session_backend
 
 
+import config
 import logging
 from flask import Flask, Response, request
 
@@ -15,9 +20,19 @@ logger = logger_setup(logger_name="flask_app", logger_filename="app.log")
 logger = logging.getLogger(f'flask_app.{__name__}')
 
 
-# Fetch current user settings
-user_settings = {}
-extractor_llm = TransactionExtractorLLM(model_name="deepseek-chat", temperature=0.0)
+# Bot sessions of the users, bounded (LRU + idle TTL) and loaded again from the database when evicted
+# With a shared session backend (SESSION_BACKEND=sqlite / redis) the app can run in many worker processes
+user_settings = SessionStore(
+    loader=load_user_session,
+    max_size=config.SESSION_MAX_ENTRIES,
+    idle_ttl=config.SESSION_IDLE_TTL,
+    backend=create_session_backend(
+        kind=config.SESSION_BACKEND,
+        sqlite_path=config.SESSION_SQLITE_PATH,
+        redis_url=config.SESSION_REDIS_URL,
+        ttl=config.SESSION_IDLE_TTL
+    )
+)
 
 
 @app.route('/api/transaction_parser_llm', methods=['POST'])
@@ -70,207 +85,294 @@ def transaction_parser_llm():
         user_id = transaction_data.get("user_id")
         user_input = transaction_data.get("user_input")
 
-        # Check if the user ID is valid and registered in the database
-        if get_user_info(user_id) is None:
-            logger.error("USER_NOT_FOUND")
+        try:
+            parse_result = parse_transaction(user_id=user_id, user_input=user_input)
+        except TransactionParseError as e:
             return create_api_response(
                 status="error",
-                message="user_id not found in the database. Please register first",
+                message=e.message,
                 error={
-                    "code": "USER_NOT_FOUND",
+                    "code": e.code,
                     "details": transaction_data
                 },
-                http_status=404
+                http_status=e.http_status
             )
 
-        # Extracts bookkeeping features by LLM
-        llm_response = extractor_llm.extract_bookkeeping_features(user_input=user_input, user_id=user_id)
-        # logger.debug("Saving money: fixed ouput")
-        # llm_response = {'is_transaction': True, 'date': '2025-07-10', 'category_type': 'Expense', 'category_name': 'Food', 'description': 'KFC', 'currency': 'HKD', 'price': 50.0}
-
-        # Check if the LLM response indicates a transaction
-        if llm_response["is_transaction"] is False:
-            logger.error("INVALID_TRANSACTION")
-            return create_api_response(
-                status="error",
-                message="The input does not contain a valid transaction",
-                error={
-                    "code": "INVALID_TRANSACTION",
-                    "details": transaction_data
-                },
-                http_status=400
-            )
-
-        # Retrieve the category ID from supabase database
-        category_id = get_category_id(llm_response["category_type"], llm_response["category_name"], user_id)
-
-        # Check if the category ID is found
-        if category_id is None:
-            logger.error("CATEGORY_NOT_FOUND")
-            return create_api_response(
-                status="error",
-                message="Category not found in the database",
-                error={
-                    "code": "CATEGORY_NOT_FOUND",
-                    "details": transaction_data
-                },
-                http_status=404
-            )
-
-        # If the LLM response indicates a transaction, prepare the transaction data
-        transactions = {
-            "user_id": user_id,
-            "date": llm_response["date"],
-            "category_id": category_id,
-            "description": llm_response["description"],
-            "currency": llm_response["currency"],
-            "amount": llm_response["price"]
-        }
-
         # Return success response with transaction and LLM response
         logger.info("Request Success ...")
         return create_api_response(
             status="success",
             message="Transaction processed successfully",
-            data={
-                "transaction": transactions,
-                "llm_response": llm_response
-            },
+            data=parse_result,
             http_status=200
         )
 
 
-
-@app.route('/', methods=['POST'])
+@app.route('/api/transaction_parser_llm/batch', methods=['POST'])
 @log_api(logger)
-def telegram():
+def transaction_parser_llm_batch():
+    """
+    Endpoint to parse many transactions at once.
+    Expects a JSON payload with 'user_id' and either 'user_inputs' (a list of inputs)
+    or 'user_input' (a text with one transaction per line).
+    Returns one result for each input; a failed input does not fail the batch.
 
-    # Handle the incoming POST request from Telegram
-    if request.method == 'POST':
+    Example payload:
+    {
+        "user_id": "123456789",
+        "user_input": "早餐 30\n午餐 55\n的士 80"
+    }
 
-        global user_settings
-        logger.debug(f"user_settings: {user_settings}")
-
-        ##################################
-        # Set Command and Callback Manager
-        ##################################
-        command_manager = CommandManager(user_settings)
-        callback_manager = CallbackManager(user_settings)
-        
-        ##################################
-        # Telgram API Response Processiong
-        ##################################
-        tg_api_response = request.get_json() # Retrieve telegram api response json
-        update_type, tg_api_response_info = parse_tg_api_respnse_info(tg_api_response)
-        logger.debug(f"tg_api_response: {tg_api_response}")
-
-        # Retrieve the `user ID` & `user text input` from telegram chatroom api response
-        tg_user_id = tg_api_response_info["message"]["chat"]["id"]
+    Return:
+    {
+        "status": "success" | "error",
+        "message": "success message" | "error message",
+        "data": {
+            "results": [
+                {"index": 0, "status": "success", "data": {"transaction": {...}, "llm_response": {...}}, "error": null},
+                {"index": 1, "status": "error", "data": null, "error": {"code": "ERROR_CODE", "message": "..."}},
+                ...
+            ]
+        } | null,
+        "error": {
+            "code": "ERROR_CODE",
+            "details": {...}
+        } | null
+    }
+    """
+    transaction_data = request.get_json(silent=True)
+
+    user_inputs = None
+    if transaction_data:
+        user_inputs = transaction_data.get("user_inputs")
+        if user_inputs is None and isinstance(transaction_data.get("user_input"), str):
+            user_inputs = [line.strip() for line in transaction_data["user_input"].splitlines() if line.strip()]
+
+    # Check if the JSON payload contains the required fields
+    if (not transaction_data) or ("user_id" not in transaction_data) or (not isinstance(user_inputs, list)) or (not user_inputs):
+        logger.error("INVALID_REQUEST")
+        return create_api_response(
+            status="error",
+            message="Please provide 'user_id' and 'user_inputs' (or a multi-line 'user_input') in the request body",
+            error={
+                "code": "INVALID_REQUEST",
+                "details": transaction_data
+            },
+            http_status=400
+        )
+
+    try:
+        results = parse_transactions_batch(
+            user_id=transaction_data["user_id"],
+            user_inputs=[str(user_input) for user_input in user_inputs],
+            batch_size=config.LLM_BATCH_SIZE
+        )
+    except TransactionParseError as e:
+        return create_api_response(
+            status="error",
+            message=e.message,
+            error={
+                "code": e.code,
+                "details": transaction_data
+            },
+            http_status=e.http_status
+        )
+
+    return create_api_response(
+        status="success",
+        message=f"{sum(result['status'] == 'success' for result in results)} of {len(results)} transactions processed successfully",
+        data={"results": results},
+        http_status=200
+    )
 
-        if not tg_api_response_info["message"].get("text"):
-            SendMessage(tg_user_id, "Please input text")
-            return Response(status=200)
 
-        user_input = tg_api_response_info["message"]["text"]
-        logger.debug(f"user_input: {user_input}")
-        
-        # Temporary information store
-        if tg_user_id not in user_settings:
-            user_settings = user_settings_initialize(tg_user_id, user_settings)
-            logger.info(f"user_settings init: {user_settings}")
+@log_function(logger)
+def process_update(tg_api_response: dict) -> None:
+    """
+    Processes one Telegram update (commands, callbacks and pending user setting options).
 
+    The session of the user is loaded from the session backend before the update is
+    handled and written back after, so any worker process can handle the next update.
 
-        ###########################
-        # User Info Default Setting
-        ###########################
+    Args:
+        tg_api_response (dict): The Telegram update json received by the webhook.
+    """
+    logger.debug(f"user_settings: {user_settings}")
+
+    ##################################
+    # Telgram API Response Processiong
+    ##################################
+    update_type, tg_api_response_info = parse_tg_api_respnse_info(tg_api_response)
+    logger.debug(f"tg_api_response: {tg_api_response}")
+
+    # Retrieve the `user ID` & `user text input` from telegram chatroom api response
+    tg_user_id = tg_api_response_info["message"]["chat"]["id"]
+
+    if not tg_api_response_info["message"].get("text"):
+        SendMessage(tg_user_id, "Please input text")
+        return
+
+    user_input = tg_api_response_info["message"]["text"]
+    logger.debug(f"user_input: {user_input}")
+    
+    # Temporary information store
+    user_settings.begin(tg_user_id)
+    try:
+        handle_user_update(update_type, tg_api_response_info, tg_user_id, user_input)
+    finally:
+        user_settings.commit(tg_user_id)
+
+@log_function(logger)
+def handle_user_update(update_type: str, tg_api_response_info: dict, tg_user_id: int, user_input: str) -> None:
+    """Handles the update of a user whose session is loaded in `user_settings`."""
+    ###########################
+    # User Info Default Setting
+    ###########################
+    # Reply to a pending question of the bot (e.g., the new username after "Change Username")
+    state_handler = conversation_states.get_handler(user_settings[tg_user_id], update_type)
+    if state_handler is not None:
         setting_manager = SettingManager(
             user_settings=user_settings,
             user_id=tg_user_id,
             user_input=user_input
         )
+        state_handler(setting_manager)
+        return
 
-        if update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'REGISTER_username':
-            user_settings = setting_manager.username_update()
-            return Response(status=200)
-        
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'REGISTER_currency':
-            user_settings = setting_manager.currency_update()
-            return Response(status=200)
-        
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_date':
-            user_settings = setting_manager.trans_date_update()
-            return Response(status=200)
+    logger.info(f"user_settings: {user_settings}")
 
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_category_type':
-            user_settings = setting_manager.trans_category_type_update()
-            return Response(status=200)
+    ########################
+    # Handle command queries
+    ########################
+    if user_input.startswith('/'):
 
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_category_name':
-            user_settings = setting_manager.trans_category_name_update()
-            return Response(status=200)
+        command = user_input.split(maxsplit=1)[0].lower()
+        user_transaction_input = user_input.split(maxsplit=1)[-1]
 
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_description':
-            user_settings = setting_manager.trans_description_update()
-            return Response(status=200)
+        user_command_dict = {
+            "user_id": tg_user_id,
+            "command": command,
+            "user_input": user_transaction_input
+        }
 
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_currency':
-            user_settings = setting_manager.trans_currency_update()
-            return Response(status=200)
+        command_exec(user_settings[tg_user_id], user_command_dict)
 
-        elif update_type in ["message", "edited_message"] and user_settings[tg_user_id].get('option') == 'TRANSACTION_amount':
-            user_settings = setting_manager.trans_amount_update()
-            return Response(status=200)
+        return
 
-        
-        logger.info(f"user_settings: {user_settings}")
+    #########################
+    # Handle callback queries
+    #########################
+    if update_type == "callback_query":
+        callback_data = tg_api_response_info["callback_data"]
 
-        ########################
-        # Handle command queries
-        ########################
-        if user_input.startswith('/'):
+        user_callback_dict = {
+            "user_id": tg_user_id,
+            "message_id": tg_api_response_info["message"].get("message_id"),
+            "callback_data": callback_data
+        }
 
-            command = user_input.split(maxsplit=1)[0].lower()
-            user_transaction_input = user_input.split(maxsplit=1)[-1]
+        callback_exec(user_settings[tg_user_id], user_callback_dict)
 
-            user_command_dict = {
-                "user_id": tg_user_id,
-                "command": command,
-                "user_input": user_transaction_input,
-                "user_settings": user_settings
-            }
+        return
 
-            return_obj = command_manager.command_exec(user_command_dict=user_command_dict)
 
-            # Update user_settings dictionary if command data in returnable_list
-            if return_obj is not None:
-                user_settings = return_obj
+@app.route('/', methods=['POST'])
+@log_api(logger)
+def telegram():
 
-            return Response(status=200)
+    # Handle the incoming POST request from Telegram
+    if request.method == 'POST':
 
-        #########################
-        # Handle callback queries
-        #########################
-        if update_type == "callback_query":
-            callback_data = tg_api_response_info["callback_data"]
+        tg_api_response = request.get_json(silent=True) # Retrieve telegram api response json
 
-            user_callback_dict = {
-                "user_id": tg_user_id,
-                "temp_transaction": user_settings[tg_user_id]["temp_transaction"],
-                "callback_data": callback_data
-            }
+        # Ignore updates that this bot does not handle
+        update_type, tg_api_response_info = parse_tg_api_respnse_info(tg_api_response or {})
+        if update_type is None:
+            logger.warning(f"Unsupported update ignored: {tg_api_response}")
+            return Response(status=200)
 
-            return_obj = callback_manager.callback_exec(user_callback_dict=user_callback_dict)
-            
-            # Update user_settings dictionary if callback data in returnable_list
-            if return_obj is not None:
-                user_settings = return_obj
+        # Telegram redelivers an update when the webhook is slow, process each update only once
+        update_id = tg_api_response.get("update_id")
+        if update_id is not None and update_deduplicator.is_duplicate(update_id):
+            logger.info(f"Duplicate update ignored: update_id={update_id}")
+            return Response(status=200)
 
+        if config.WEBHOOK_INGEST_MODE == "sync":
+            try:
+                process_update(tg_api_response)
+            except Exception:
+                # Accept the redelivery of the update that failed
+                if update_id is not None:
+                    update_deduplicator.forget(update_id)
+                raise
             return Response(status=200)
 
+        # Acknowledge at once, the update is processed by the worker of this user's shard
+        tg_user_id = tg_api_response_info["message"]["chat"]["id"]
+        if not update_dispatcher.submit(tg_api_response, key=tg_user_id):
+            # Telegram redelivers the update later when the webhook does not return 2xx
+            if update_id is not None:
+                update_deduplicator.forget(update_id)
+            return Response(status=503)
+
+        return Response(status=200)
+
     else:
         return "<h1>Nothing Here</h1>"
 
-    return Response(status=200)
+
+# Recently seen update IDs, shared by the worker processes through the session backend if there is one
+if user_settings.backend is not None:
+    update_deduplicator = SharedUpdateDeduplicator(
+        backend=user_settings.backend,
+        ttl=config.WEBHOOK_DEDUPE_TTL,
+        window_size=config.WEBHOOK_DEDUPE_WINDOW
+    )
+else:
+    update_deduplicator = UpdateDeduplicator(window_size=config.WEBHOOK_DEDUPE_WINDOW)
+
+
+@app.route('/api/update_queue_stats', methods=['GET'])
+def update_queue_stats():
+    """Returns the queue depth and wait time of each update dispatcher shard, the outgoing message backlog per chat and the transaction write buffer flush stats."""
+    return create_api_response(
+        status="success",
+        message="Update queue stats",
+        data={
+            "shards": update_dispatcher.stats(),
+            "duplicates": update_deduplicator.duplicates,
+            "outbound_backlog": outbound_sender.backlog(),
+            "transaction_write_buffer": transaction_write_buffer.stats()
+        },
+        http_status=200
+    )
+
+
+@app.route('/api/cache_stats', methods=['GET'])
+def cache_stats():
+    """Returns the hit / miss counters of the in-process caches and of the fast path parser, and the profile update coalescing counters."""
+    return create_api_response(
+        status="success",
+        message="Cache stats",
+        data={
+            "sessions": user_settings.stats(),
+            "categories": category_cache.stats(),
+            "profile_updates": profile_update_coalescer.stats(),
+            "monthly_summary": monthly_summary_cache.stats(),
+            "llm_extraction": extraction_cache.stats(),
+            "fast_path": fast_path_extractor.stats()
+        },
+        http_status=200
+    )
+
+
+# Background workers for the webhook (see `process_update`)
+# Updates of one user are processed in order, different users in parallel
+update_dispatcher = ShardedUpdateDispatcher(
+    handler=process_update,
+    num_workers=config.WEBHOOK_WORKERS,
+    max_queue_size=config.WEBHOOK_QUEUE_SIZE
+)
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000, use_reloader=True)
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of the non-network overhead of one LLM transaction extraction.
+
+Compares building the structured output chain on every call (old behaviour) with
+reusing the chain built once by `TransactionExtractorLLM`. The chat model is a
+stubbed ChatDeepSeek that returns a fixed tool call, so no request leaves the machine.
+
+Usage:
+    python benchmark_llm_chain.py [iterations]
+"""
+import os
+import sys
+import time
+
+# Dummy settings so that config.py / supabase_api.py can be imported without a .env file
+os.environ.setdefault("DEEPSEEK_API_KEY", "stub")
+os.environ.setdefault("PERPLEXITY_API_KEY", "stub")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "stub")
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "stub.stub.stub")
+
+import logging
+from datetime import date
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_deepseek import ChatDeepSeek
+
+import llm_tools
+from llm_tools import TransactionExtractorLLM, TransactionData
+
+USER_CATEGORIES = [
+    ("Income", "Salary"),
+    ("Expense", "Food"),
+    ("Expense", "Transport"),
+    ("Expense", "Entertainment"),
+    ("Expense", "Shopping")
+]
+
+class StubChatDeepSeek(ChatDeepSeek):
+    """ChatDeepSeek that answers every request with the same TransactionData tool call."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = AIMessage(
+            content="",
+            tool_calls=[
+                {
+                    "name": TransactionData.__name__,
+                    "args": {
+                        "is_transaction": True,
+                        "date": date.today().isoformat(),
+                        "category_type": "Expense",
+                        "category_name": "Food",
+                        "description": "KFC",
+                        "currency": "HKD",
+                        "price": 50.0
+                    },
+                    "id": "call_0"
+                }
+            ]
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+def extract_rebuilding_chain(extractor: TransactionExtractorLLM, user_input: str, user_id: int) -> dict:
+    """The old extraction, which builds the structured output chain on every call."""
+    structured_llm = extractor.llm.with_structured_output(TransactionData)
+    chain = extractor.prompt | structured_llm
+
+    response_model = chain.invoke({
+        "user_message": user_input,
+        "current_date": date.today().isoformat(),
+        "user_categories": llm_tools.get_user_categories_info(user_id)
+    })
+
+    return response_model.model_dump()
+
+def time_per_call(func, iterations: int) -> float:
+    """Returns the mean seconds per call of `func` (after one warm-up call)."""
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # Keep the debug logs of the extractor out of the measurement
+    logging.getLogger("flask_app").setLevel(logging.WARNING)
+
+    # No database round-trip for the categories of the prompt
+    llm_tools.get_user_categories_info = lambda user_id: USER_CATEGORIES
+
+    extractor = TransactionExtractorLLM(
+        model_name="deepseek-chat",
+        llm=StubChatDeepSeek(model="deepseek-chat", api_key="stub")
+    )
+
+    rebuild_time = time_per_call(lambda: extract_rebuilding_chain(extractor, "KFC 50", 1), iterations)
+    reuse_time = time_per_call(lambda: extractor.extract_bookkeeping_features("KFC 50", 1), iterations)
+
+    print(f"iterations: {iterations}")
+    print(f"chain rebuilt per call: {rebuild_time * 1e6:10.1f} us/extraction")
+    print(f"chain reused:           {reuse_time * 1e6:10.1f} us/extraction")
+    print(f"saved per extraction:   {(rebuild_time - reuse_time) * 1e6:10.1f} us ({rebuild_time / reuse_time:.2f}x)")
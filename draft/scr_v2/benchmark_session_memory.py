@@ -0,0 +1,72 @@
+"""
+Memory benchmark of the bot sessions.
+
+Compares the footprint of N sessions stored as nested dicts (old `user_settings`
+entries) with the slotted `UserSession` / `PendingTransaction` records. Every
+session has a pending transaction, the worst case of a busy bot.
+
+Usage:
+    python benchmark_session_memory.py [sessions]
+"""
+import sys
+import tracemalloc
+
+from session_models import UserSession, PendingTransaction, SessionOption
+
+CURRENCIES = ["HKD", "USD", "JPY"]
+
+def make_transaction(i: int) -> dict:
+    # Built at runtime like the LLM responses, so the strings are not shared constants
+    return {
+        "user_id": 100000000 + i,
+        "date": f"2025-07-{i % 28 + 1:02d}",
+        "category_id": i % 20,
+        "category_type": "".join(["Exp", "ense"]),
+        "category_name": "".join(["Fo", "od"]),
+        "description": f"KFC {i}",
+        "currency": "".join(CURRENCIES[i % 3]),
+        "amount": float(i % 500)
+    }
+
+def dict_sessions(count: int) -> dict:
+    return {
+        100000000 + i: {
+            "username": f"user_{i}",
+            "default_currency": "".join(CURRENCIES[i % 3]),
+            "temp_transaction": make_transaction(i),
+            "message_id": i,
+            "option": "".join(["TRANSACTION_", "amount"])
+        }
+        for i in range(count)
+    }
+
+def slotted_sessions(count: int) -> dict:
+    return {
+        100000000 + i: UserSession(
+            username=f"user_{i}",
+            default_currency="".join(CURRENCIES[i % 3]),
+            temp_transaction=PendingTransaction.from_dict(make_transaction(i)),
+            message_id=i,
+            option=SessionOption.TRANSACTION_AMOUNT
+        )
+        for i in range(count)
+    }
+
+def measure(build, count: int) -> int:
+    tracemalloc.start()
+    sessions = build(count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del sessions
+    return size
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    dict_size = measure(dict_sessions, count)
+    slotted_size = measure(slotted_sessions, count)
+
+    print(f"sessions: {count}")
+    print(f"nested dicts:     {dict_size / 2**20:8.1f} MiB ({dict_size / count:6.0f} B / session)")
+    print(f"slotted records:  {slotted_size / 2**20:8.1f} MiB ({slotted_size / count:6.0f} B / session)")
+    print(f"saved: {(1 - slotted_size / dict_size) * 100:.1f}%")
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark of a dashboard date filter on a user with years of transactions.
+
+Compares the boolean mask over the whole DataFrame plus pandas groupby (old
+behaviour) with `TransactionFrame` (searchsorted range + bincount totals) on
+synthetic data.
+
+Usage:
+    python benchmark_transaction_frame.py [rows] [iterations]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from transaction_frame import TransactionFrame
+
+CATEGORIES = [
+    ("Income", "Salary"),
+    ("Expense", "Food"),
+    ("Expense", "Transport"),
+    ("Expense", "Entertainment"),
+    ("Expense", "Shopping")
+]
+
+def make_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    category_codes = rng.integers(0, len(CATEGORIES), rows)
+
+    return pd.DataFrame({
+        "date": pd.to_datetime(np.datetime64("2020-01-01") + rng.integers(0, 5 * 365, rows)),
+        "category_type": [CATEGORIES[code][0] for code in category_codes],
+        "category_name": [CATEGORIES[code][1] for code in category_codes],
+        "amount": rng.uniform(1, 500, rows).round(2)
+    })
+
+def filter_with_mask(frame: pd.DataFrame, start_date: date, end_date: date):
+    selected = frame[(frame['date'].dt.date >= start_date) & (frame['date'].dt.date <= end_date)]
+    return (
+        selected.groupby("date")["amount"].sum(),
+        selected.groupby("category_type")["amount"].sum(),
+        selected.groupby("category_name")["amount"].sum()
+    )
+
+def filter_with_columns(columns: TransactionFrame, start_date: date, end_date: date):
+    return (
+        columns.daily_totals(start_date, end_date),
+        columns.type_totals(start_date, end_date),
+        columns.category_totals(start_date, end_date)
+    )
+
+def benchmark(function, iterations: int, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(*args)
+    return (time.perf_counter() - start) / iterations * 1000
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    start_date, end_date = date(2023, 7, 1), date(2023, 7, 31)
+
+    frame = make_frame(rows)
+
+    build_start = time.perf_counter()
+    columns = TransactionFrame.from_frame(frame)
+    build_ms = (time.perf_counter() - build_start) * 1000
+
+    mask_ms = benchmark(filter_with_mask, iterations, frame, start_date, end_date)
+    columns_ms = benchmark(filter_with_columns, iterations, columns, start_date, end_date)
+
+    print(f"rows: {rows}, iterations: {iterations}")
+    print(f"TransactionFrame build (once per fetch): {build_ms:.2f} ms")
+    print(f"mask + groupby:            {mask_ms:.3f} ms / filter")
+    print(f"searchsorted + bincount:   {columns_ms:.3f} ms / filter")
+    print(f"speedup: {mask_ms / columns_ms:.1f}x")
@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    A thread-safe in-process cache with a maximum size (least recently used entries
+    are evicted first) and a time-to-live for each entry.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        """
+        Args:
+            max_size (int): Maximum number of entries.
+            ttl (float): Seconds an entry stays valid after it is set.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Returns the cached value of `key`, or `default` if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value) -> None:
+        """Caches `value` under `key`, evicting the least recently used entry if the cache is full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value of `key`, calling `loader()` and caching its result on a miss.
+
+        Example:
+            >>> cache.get_or_load(user_id, lambda: get_user_info(user_id))
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key) -> None:
+        """Removes `key` from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Returns the cache size and hit / miss / eviction counters."""
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
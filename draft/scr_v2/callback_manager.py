@@ -1,232 +1,265 @@
+import html
 import logging
 
 from utils import *
 from telegram_api import *
 from supabase_api import *
+from transaction_service import fast_path_extractor, transaction_write_buffer
+from session_models import UserSession, SessionOption
 
 logger = logging.getLogger(f'flask_app.{__name__}')
 
-@log_function(logger)
-class CallbackManager:
-    
-    def __init__(self, user_settings: dict):
-        """Initializes the CommandManager."""
-        self.user_settings = user_settings
-        self.callbacks = {
-            "REGISTER_change_username": self.REGISTER_change_username,
-            "REGISTER_change_currency": self.REGISTER_change_currency,
-            "TRANSACTION_change_date": self.TRANSACTION_change_date,
-            "TRANSACTION_category_type": self.TRANSACTION_category_type,
-            "TRANSACTION_category_name": self.TRANSACTION_category_name,
-            "TRANSACTION_description": self.TRANSACTION_description,
-            "TRANSACTION_currency": self.TRANSACTION_currency,
-            "TRANSACTION_amount": self.TRANSACTION_amount,
-            "TRANSACTION_save": self.TRANSACTION_save
-        }
-
-    @log_function(logger)
-    def callback_exec(self, user_callback_dict: dict) -> None | dict:
-        """
-        Executes the callback based on user input.
-
-        Args:
-            user_callback_dict (dict): A dictionary containing user callback details.
-
-        Example:
-            >>> user_callback_dict = {
-                    "user_id": 123456789,
-                    "callback_data": "change_username"
-                }
-            >>> CallbackManager().callback_exec(user_callback_dict)
-        """
-        returnable_list = [
-            "REGISTER_change_username",
-            "REGISTER_change_currency",
-            "TRANSACTION_change_date",
-            "TRANSACTION_category_type",
-            "TRANSACTION_category_name",
-            "TRANSACTION_description",
-            "TRANSACTION_currency",
-            "TRANSACTION_amount",
-            "TRANSACTION_save"
-        ]
-        callback_data = user_callback_dict["callback_data"]
-        
-        if callback_data in self.callbacks:
-            return_obj = self.callbacks[callback_data](user_callback_dict)
-
-            return return_obj if (callback_data in returnable_list) or (return_obj is not None) else None
-
-    
-    @log_function(logger)
-    def REGISTER_change_username(self, user_callback_dict: dict) -> None:
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'REGISTER_username'
-
-        # Prompt user to change username
-        change_username_message = (
-            "<b>🔄 Change Username</b>\n\n"
-            "Please send me your new username:"
-        )
-        SendMessage(user_id, change_username_message)
-
-        return self.user_settings
-
-    @log_function(logger)
-    def REGISTER_change_currency(self, user_callback_dict: dict) -> None:
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'REGISTER_currency'
-
-        # Prompt user to change currency
-        change_currency_message = (
-            "<b>🔄 Change Currency</b>\n\n"
-            "Please send me your new currency:"
-        )
-        SendMessage(user_id, change_currency_message)
-
-        return self.user_settings
-    
-    @log_function(logger)
-    def TRANSACTION_change_date(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
-
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_date'
-
-        # Prompt user to change currency
-        change_date_message = (
-            "<b>🔄 Change Date</b>\n\n"
-            "Please send me the correct date in the format shown in the examples below:\n"
-            "✅️ 2023/10/01\n"
-            "✅️ 10-01-2023\n"
-            "✅️ October 1, 2023\n"
-            "✅️ 01 Oct 2023\n"
-            "✅️ 2023.10.01\n"
-            "✅️ 20250601\n"
-            "❌ invalid_date"
-        )
-        SendMessage(user_id, change_date_message)
-
-        return self.user_settings
-    
-    @log_function(logger)
-    def TRANSACTION_category_type(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
-
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_category_type'
-
-        # Prompt user to change currency
-        change_category_type_message = (
-            "<b>🔄 Change Category Type</b>\n\n"
-            "Please send me the correct category type:"
-        )
-        SendMessage(user_id, change_category_type_message)
-
-        return self.user_settings
-
-    @log_function(logger)
-    def TRANSACTION_category_name(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
-        
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_category_name'
-
-        # Prompt user to change currency
-        change_category_type_message = (
-            "<b>🔄 Change Category Name</b>\n\n"
-            "Please send me the correct category type:"
-        )
-        SendMessage(user_id, change_category_type_message)
-
-        return self.user_settings
-
-    @log_function(logger)
-    def TRANSACTION_description(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
-
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_description'
-
-        # Prompt user to change currency
-        change_description_message = (
-            "<b>🔄 Change Description</b>\n\n"
-            "Please send me the correct description:"
-        )
-        SendMessage(user_id, change_description_message)
-
-        return self.user_settings
-
-    @log_function(logger)
-    def TRANSACTION_currency(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
-        
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_currency'
-
-        # Prompt user to change currency
-        change_currency_message = (
-            "<b>🔄 Change Currency</b>\n\n"
-            "Please send me the correct currency:"
-        )
-        SendMessage(user_id, change_currency_message)
+# Callback query handlers by callback data, registered once at import with @callback
+CALLBACKS = {}
+# Handlers of callback data with a parameter (e.g., "SUMMARY_2025-07") by prefix
+CALLBACK_PREFIXES = {}
+
+def callback(callback_data: str, prefix: bool = False):
+    """
+    Registers the handler of a callback query, called as handler(session, user_callback_dict).
+
+    Args:
+        callback_data (str): The callback data of the inline keyboard button, or its prefix.
+        prefix (bool): Handle all callback data starting with `callback_data` (must end with "_").
+
+    Example:
+        >>> @callback("TRANSACTION_save")
+        >>> def TRANSACTION_save(session: UserSession, user_callback_dict: dict) -> None:
+        >>>     ...
+    """
+    def decorator(handler):
+        (CALLBACK_PREFIXES if prefix else CALLBACKS)[callback_data] = handler
+        return handler
+    return decorator
 
-        return self.user_settings
+@log_function(logger)
+def callback_exec(session: UserSession, user_callback_dict: dict) -> None:
+    """
+    Executes the callback based on user input.
+
+    Args:
+        session (UserSession): The session of the user.
+        user_callback_dict (dict): A dictionary containing user callback details.
+
+    Example:
+        >>> user_callback_dict = {
+                "user_id": 123456789,
+                "message_id": 42,
+                "callback_data": "REGISTER_change_username"
+            }
+        >>> callback_exec(user_settings[123456789], user_callback_dict)
+    """
+    callback_data = user_callback_dict["callback_data"]
+
+    handler = CALLBACKS.get(callback_data)
+    if handler is None:
+        handler = CALLBACK_PREFIXES.get(callback_data.split("_", 1)[0] + "_")
+
+    if handler is not None:
+        handler(session, user_callback_dict)
+
+@callback("REGISTER_change_username")
+@log_function(logger)
+def REGISTER_change_username(session: UserSession, user_callback_dict: dict) -> None:
+    user_id = user_callback_dict["user_id"]
+    session.option = SessionOption.REGISTER_USERNAME
+
+    # Prompt user to change username
+    change_username_message = (
+        "<b>🔄 Change Username</b>\n\n"
+        "Please send me your new username:"
+    )
+    SendMessage(user_id, change_username_message)
+
+@callback("REGISTER_change_currency")
+@log_function(logger)
+def REGISTER_change_currency(session: UserSession, user_callback_dict: dict) -> None:
+    user_id = user_callback_dict["user_id"]
+    session.option = SessionOption.REGISTER_CURRENCY
+
+    # Prompt user to change currency
+    change_currency_message = (
+        "<b>🔄 Change Currency</b>\n\n"
+        "Please send me your new currency:"
+    )
+    SendMessage(user_id, change_currency_message)
+
+@callback("TRANSACTION_change_date")
+@log_function(logger)
+def TRANSACTION_change_date(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_DATE
+
+    # Prompt user to change currency
+    change_date_message = (
+        "<b>🔄 Change Date</b>\n\n"
+        "Please send me the correct date in the format shown in the examples below:\n"
+        "✅️ 2023/10/01\n"
+        "✅️ 10-01-2023\n"
+        "✅️ October 1, 2023\n"
+        "✅️ 01 Oct 2023\n"
+        "✅️ 2023.10.01\n"
+        "✅️ 20250601\n"
+        "❌ invalid_date"
+    )
+    SendMessage(user_id, change_date_message)
+
+@callback("TRANSACTION_category_type")
+@log_function(logger)
+def TRANSACTION_category_type(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_CATEGORY_TYPE
+
+    # Prompt user to change currency
+    change_category_type_message = (
+        "<b>🔄 Change Category Type</b>\n\n"
+        "Please send me the correct category type:"
+    )
+    SendMessage(user_id, change_category_type_message)
+
+@callback("TRANSACTION_category_name")
+@log_function(logger)
+def TRANSACTION_category_name(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_CATEGORY_NAME
+
+    # Prompt user to change currency
+    change_category_type_message = (
+        "<b>🔄 Change Category Name</b>\n\n"
+        "Please send me the correct category type:"
+    )
+    SendMessage(user_id, change_category_type_message)
+
+@callback("TRANSACTION_description")
+@log_function(logger)
+def TRANSACTION_description(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_DESCRIPTION
+
+    # Prompt user to change currency
+    change_description_message = (
+        "<b>🔄 Change Description</b>\n\n"
+        "Please send me the correct description:"
+    )
+    SendMessage(user_id, change_description_message)
+
+@callback("TRANSACTION_currency")
+@log_function(logger)
+def TRANSACTION_currency(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_CURRENCY
+
+    # Prompt user to change currency
+    change_currency_message = (
+        "<b>🔄 Change Currency</b>\n\n"
+        "Please send me the correct currency:"
+    )
+    SendMessage(user_id, change_currency_message)
+
+@callback("TRANSACTION_amount")
+@log_function(logger)
+def TRANSACTION_amount(session: UserSession, user_callback_dict: dict) -> None:
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    user_id = user_callback_dict["user_id"]
+    session.message_id = user_callback_dict.get("message_id")
+    session.option = SessionOption.TRANSACTION_AMOUNT
+
+    # Prompt user to change currency
+    change_amount_message = (
+        "<b>🔄 Change Amount</b>\n\n"
+        "Please send me the correct amount:"
+    )
+    SendMessage(user_id, change_amount_message)
+
+@callback("SUMMARY_", prefix=True)
+@log_function(logger)
+def SUMMARY_change_month(session: UserSession, user_callback_dict: dict) -> None:
+    user_id = user_callback_dict["user_id"]
 
-    @log_function(logger)
-    def TRANSACTION_amount(self, user_callback_dict: dict) -> None:
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
+    # Callback data comes from the client, check it like the /monthlysummary argument
+    try:
+        month = SummaryManager.parse_month(user_callback_dict["callback_data"].removeprefix("SUMMARY_"))
+    except ValueError:
+        logger.warning(f"Invalid summary month in callback data: {user_callback_dict['callback_data']}")
+        SendMessage(user_id, "This summary button is no longer valid, please use <b>/monthlysummary</b>.")
+        return
 
-        user_id = user_callback_dict["user_id"]
-        self.user_settings[user_id]['option'] = 'TRANSACTION_amount'
+    # Replace the shown month in the same summary message
+    SummaryManager.monthly_summary_keyboard(user_id, month, user_callback_dict.get("message_id"))
 
-        # Prompt user to change currency
-        change_amount_message = (
-            "<b>🔄 Change Amount</b>\n\n"
-            "Please send me the correct amount:"
+@callback("TRANSACTION_save")
+@log_function(logger)
+def TRANSACTION_save(session: UserSession, user_callback_dict: dict) -> None:
+    user_id = user_callback_dict["user_id"]
+
+    temp_transaction = session.temp_transaction
+    if temp_transaction is None:
+        return
+
+    # Save data into database
+    category_type = temp_transaction.category_type
+    category_name = temp_transaction.category_name
+    temp_transaction.category_id = get_category_id(category_type, category_name, user_id)
+
+    # The row is inserted later, reject now what the database would reject at flush time
+    errors = temp_transaction.validation_errors()
+    if errors:
+        error_message = (
+            "<b>❌ Transaction not saved</b>\n\n"
+            + "\n".join(f"• {html.escape(error)}" for error in errors)
+            + "\n\nPlease change the transaction and save again."
         )
-        SendMessage(user_id, change_amount_message)
-
-        return self.user_settings
+        SendMessage(user_id, error_message)
+        return
 
-    @log_function(logger)
-    def TRANSACTION_save(self, user_callback_dict: dict) -> None:
-        user_id = user_callback_dict["user_id"]
+    temp_transaction.amount = float(temp_transaction.amount)
 
-        temp_transaction = user_callback_dict["temp_transaction"]
-        if temp_transaction is None:
-            return None
+    # Buffered and inserted in the background, the pending ID is returned at once
+    pending_id = transaction_write_buffer.add(temp_transaction.to_row())
 
-        # Save data into database
-        category_type = temp_transaction["category_type"]
-        category_name = temp_transaction["category_name"]
-        temp_transaction["category_id"] = get_category_id(category_type, category_name, user_id)
+    # Teach the fast path parser the category of this merchant
+    fast_path_extractor.learn(user_id, temp_transaction.description, temp_transaction.category_id)
 
-        del temp_transaction["category_type"]
-        del temp_transaction["category_name"]
+    # Remove the edit buttons from the saved transaction card
+    if user_callback_dict.get("message_id") is not None:
+        EditMessageReplyMarkup(user_id, user_callback_dict["message_id"])
 
-        transaction_insert(temp_transaction)
-
-        self.user_settings[user_id]["temp_transaction"] = None
-
-        # Prompt user to change currency
-        save_message = (
-            "Transaction have been saved!"
-            "\n\n"
-            "You may click <b>/start</b> or <b>/help</b> to get more information."
-        )
-        SendMessage(user_id, save_message)
+    session.temp_transaction = None
+    session.message_id = None
 
-        return self.user_settings
\ No newline at end of file
+    # Prompt user to change currency
+    save_message = (
+        "Transaction have been saved!"
+        f"\n<b>Reference:</b> <code>{pending_id}</code>"
+        "\n\n"
+        "You may click <b>/start</b> or <b>/help</b> to get more information."
+    )
+    SendMessage(user_id, save_message)
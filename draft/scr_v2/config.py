@@ -36,6 +36,64 @@ SUPABASE_KEY = required_vars["SUPABASE_KEY"]
 TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
 # SUPABASE_CLIENT = supabase.create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Webhook ingest settings (optional, with defaults)
+# "queue": acknowledge the webhook at once and process the update on the worker pool
+# "sync": process the update inside the request (old behaviour)
+WEBHOOK_INGEST_MODE = os.getenv("WEBHOOK_INGEST_MODE", "queue")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+# Number of recent update IDs remembered to drop updates redelivered by Telegram
+WEBHOOK_DEDUPE_WINDOW = int(os.getenv("WEBHOOK_DEDUPE_WINDOW", "10000"))
+# Seconds an update ID is remembered in the shared session backend (SESSION_BACKEND=sqlite / redis)
+WEBHOOK_DEDUPE_TTL = float(os.getenv("WEBHOOK_DEDUPE_TTL", "86400"))
+
+# Telegram Bot API HTTP client settings (optional, with defaults)
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "3.05"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+# Maximum number of keep-alive connections kept open to api.telegram.org
+TELEGRAM_POOL_MAXSIZE = int(os.getenv("TELEGRAM_POOL_MAXSIZE", "10"))
+# "async": queue outgoing messages on the rate limited sender, "sync": send them in the handler
+TELEGRAM_SEND_MODE = os.getenv("TELEGRAM_SEND_MODE", "async")
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+
+# LLM extraction result cache (optional, with defaults)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "10000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+# SQLite file to keep the cache over restarts, memory only if not set
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+# Maximum number of inputs packed into one batch extraction LLM call
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "50"))
+
+# Write-behind buffer of saved transactions (optional, with defaults)
+# Each worker process writes its own spool file "<WRITE_BUFFER_SPOOL_PATH>.<pid>"
+WRITE_BUFFER_SPOOL_PATH = os.getenv("WRITE_BUFFER_SPOOL_PATH", "transaction_spool.jsonl")
+WRITE_BUFFER_MAX_ROWS = int(os.getenv("WRITE_BUFFER_MAX_ROWS", "50"))
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "2"))
+# Maximum seconds between the retries of a flush while the database is unreachable
+WRITE_BUFFER_MAX_BACKOFF = float(os.getenv("WRITE_BUFFER_MAX_BACKOFF", "60"))
+
+# Rule-based fast path in front of the LLM for simple inputs like "KFC 50"
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.8"))
+FAST_PATH_MIN_SUPPORT = int(os.getenv("FAST_PATH_MIN_SUPPORT", "2"))
+
+# Bot sessions kept in memory (the rest are loaded again from the database when used)
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+
+# Session storage shared by the worker processes: "memory" (one process only), "sqlite" (one host) or "redis"
+# The update deduplication is shared through it too. The monthly summary cache (supabase_api) stays per
+# process: with many workers keep MONTHLY_SUMMARY_CACHE_TTL short, a worker that did not flush new rows
+# serves its cached summary until it expires.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", "sessions.sqlite3")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Seconds a pending bot question (e.g., "send me the new amount") waits for the reply, 0 = no timeout
+CONVERSATION_STATE_TIMEOUT = float(os.getenv("CONVERSATION_STATE_TIMEOUT", "900"))
+
 print("All required environment variables are set.")
 
 
@@ -60,4 +118,4 @@ print("All required environment variables are set.")
 #     SUPABASE_KEY,
 #     SUPABASE_CLIENT
 # ]):
-#     raise ValueError("One or more required environment variables are not set.")
\ No newline at end of file
+#     raise ValueError("One or more required environment variables are not set.")
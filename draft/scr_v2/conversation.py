@@ -0,0 +1,74 @@
+import time
+import config
+import logging
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+MESSAGE_UPDATES = ("message", "edited_message")
+
+class ConversationStateMachine:
+    """
+    Table of the conversation states of the bot (the `option` of a session).
+
+    Each (state, update type) pair maps to the handler of the user's reply, so finding
+    the handler is one dict lookup however many states are registered. A state older
+    than its timeout is cleared, and the update is then handled as if no state was set.
+    """
+
+    def __init__(self, default_timeout: float = 900):
+        """
+        Args:
+            default_timeout (float): Seconds a state is kept when it has no timeout of its own (0 = never expires).
+        """
+        self.default_timeout = default_timeout
+        self._handlers = {}
+        self._timeouts = {}
+
+        self.expired = 0
+
+    def on(self, state, update_types: tuple[str, ...] = MESSAGE_UPDATES, timeout: float = None):
+        """
+        Registers the handler of `state` for the given update types.
+
+        Args:
+            state (SessionOption): The state the handler answers.
+            update_types (tuple[str, ...]): The update types handled in this state.
+            timeout (float, optional): Seconds the state is kept, `default_timeout` if None.
+
+        Example:
+            >>> @conversation_states.on(SessionOption.TRANSACTION_DATE)
+            >>> def trans_date_update(self): ...
+        """
+        def decorator(handler):
+            for update_type in update_types:
+                self._handlers[(state, update_type)] = handler
+            if timeout is not None:
+                self._timeouts[state] = timeout
+            return handler
+        return decorator
+
+    def get_handler(self, session, update_type: str):
+        """
+        Returns the handler of the session's state for an update, or None if the update is not part of a conversation.
+
+        Clears the state of the session if it timed out.
+        """
+        state = session.option
+        if state is None:
+            return None
+
+        timeout = self._timeouts.get(state, self.default_timeout)
+        if timeout and session.option_set_at is not None and time.time() - session.option_set_at >= timeout:
+            logger.info(f"Cleared the stale conversation state {state.value}")
+            session.option = None
+            self.expired += 1
+            return None
+
+        return self._handlers.get((state, update_type))
+
+    def states(self) -> list:
+        """Returns the registered states."""
+        return list(dict.fromkeys(state for state, _ in self._handlers))
+
+# Conversation states of the bot, the handlers are registered by SettingManager (utils.py)
+conversation_states = ConversationStateMachine(default_timeout=config.CONVERSATION_STATE_TIMEOUT)
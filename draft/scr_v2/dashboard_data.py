@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import threading
+import pandas as pd
+from datetime import date
+
+from cache import TTLCache
+from transaction_frame import TransactionFrame
+from supabase_api import *
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+TRANSACTION_COLUMNS = ["created_at", "updated_at", "date", "category_id", "description", "currency", "amount"]
+FRAME_COLUMNS = ["created_at", "updated_at", "date", "category_type", "category_name", "description", "currency", "amount"]
+
+class DashboardDataStore:
+    """
+    Per-user data of the Streamlit dashboard, shared by all sessions of the process.
+
+    The recent transactions of a user (the last `months` calendar months) are fetched
+    once into a DataFrame (joined with the categories). Within `ttl` seconds the frame is
+    served without any query; after that, one single-row query on the latest `updated_at`
+    decides whether the frame is still current or must be fetched again. Date filters and
+    totals in that window are answered from a date-sorted TransactionFrame of the cached
+    rows (binary search + bincount).
+
+    Ranges starting before the window are not cached: their rows are read with a
+    date-filtered query and their totals are aggregated by the database
+    (`get_transaction_summary`), so an old range never loads the whole history.
+    """
+
+    def __init__(self, ttl: float = 60, max_users: int = 256, months: int = 12):
+        """
+        Args:
+            ttl (float): Seconds a frame is served before its version is checked again.
+            max_users (int): Maximum number of users whose frames are kept (least recently used are evicted).
+            months (int): Calendar months of transactions kept per user, including the current month (0 keeps the whole history).
+        """
+        self.ttl = ttl
+        self.months = months
+        # Entries stay while they are used, the version check decides if they are current
+        self._frames = TTLCache(max_size=max_users, ttl=max(ttl * 60, 3600))
+        self._user_info = TTLCache(max_size=max_users, ttl=ttl)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.range_queries = 0
+        self.last_fetch_ms = 0.0
+        self.total_fetch_ms = 0.0
+
+    def get_user_info(self, user_id: int) -> dict | None:
+        return self._user_info.get_or_load(str(user_id), lambda: get_user_info(user_id))
+
+    def get_frame(self, user_id: int) -> pd.DataFrame:
+        """
+        Returns the cached active transactions of a user, the last `months` months (columns FRAME_COLUMNS, `date` as datetime).
+
+        Example:
+            >>> dashboard_data.get_frame(123456789).head(1)
+                created_at  updated_at  date        category_type  category_name  description  currency  amount
+            0   ...         ...         2025-07-01  Expense        Food           KFC          HKD       50.0
+        """
+        return self._get_entry(user_id)["frame"]
+
+    def get_transactions(self, user_id: int, start_date, end_date) -> pd.DataFrame:
+        """Returns the user's transactions from `start_date` to `end_date` (inclusive) in date order."""
+        if not self._is_cached(start_date):
+            self._count_range_query()
+            return self._load_frame(user_id, self._iso_date(start_date), self._iso_date(end_date))
+
+        entry = self._get_entry(user_id)
+        return entry["frame"].iloc[entry["columns"].row_positions(start_date, end_date)]
+
+    def get_totals(self, user_id: int, start_date, end_date) -> dict[str, pd.DataFrame]:
+        """
+        Returns the daily, per-type and per-category totals of the user from `start_date` to `end_date`.
+
+        Example:
+            >>> dashboard_data.get_totals(123456789, date(2025, 7, 1), date(2025, 7, 31))["daily_totals"]
+                date        amount  count
+            0   2025-07-01  96.0    2
+        """
+        if not self._is_cached(start_date):
+            self._count_range_query()
+            return self._summary_totals(
+                get_transaction_summary(user_id, self._iso_date(start_date), self._iso_date(end_date))
+            )
+
+        columns = self._get_entry(user_id)["columns"]
+
+        days, day_totals, day_counts = columns.daily_totals(start_date, end_date)
+        types, type_totals, type_counts = columns.type_totals(start_date, end_date)
+        categories, category_totals, category_counts = columns.category_totals(start_date, end_date)
+
+        return {
+            "daily_totals": pd.DataFrame({"date": days.astype("datetime64[ns]"), "amount": day_totals, "count": day_counts}),
+            "type_totals": pd.DataFrame({"category_type": types, "amount": type_totals, "count": type_counts}),
+            "category_totals": pd.DataFrame({
+                "category_type": [category_type for category_type, _ in categories],
+                "category_name": [category_name for _, category_name in categories],
+                "amount": category_totals,
+                "count": category_counts
+            })
+        }
+
+    def _get_entry(self, user_id: int) -> dict:
+        entry = self._frames.get(str(user_id))
+
+        if entry is not None and time.monotonic() - entry["checked_at"] < self.ttl:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        start = time.perf_counter()
+        version = get_transactions_version(user_id)
+
+        if entry is not None and entry["version"] == version:
+            # Nothing changed since the frame was fetched
+            entry["checked_at"] = time.monotonic()
+            self._frames.set(str(user_id), entry)
+            with self._lock:
+                self.revalidations += 1
+            return entry
+
+        frame = self._load_frame(user_id, self._window_start().isoformat() if self.months else None)
+        entry = {
+            "frame": frame,
+            "columns": TransactionFrame.from_frame(frame),
+            "version": version,
+            "checked_at": time.monotonic()
+        }
+        self._frames.set(str(user_id), entry)
+
+        fetch_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.misses += 1
+            self.last_fetch_ms = fetch_ms
+            self.total_fetch_ms += fetch_ms
+        logger.info(f"Fetched {len(frame)} transactions of user {user_id} in {fetch_ms:.1f} ms")
+
+        return entry
+
+    def invalidate(self, user_id: int) -> None:
+        """Drops the cached data of a user."""
+        self._frames.invalidate(str(user_id))
+        self._user_info.invalidate(str(user_id))
+
+    def stats(self) -> dict:
+        """Returns the hit / revalidation / miss counters and the fetch time."""
+        with self._lock:
+            requests = self.hits + self.revalidations + self.misses
+            return {
+                "users": len(self._frames),
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "range_queries": self.range_queries,
+                "hit_rate": round((self.hits + self.revalidations) / requests, 4) if requests else 0.0,
+                "last_fetch_ms": round(self.last_fetch_ms, 1),
+                "avg_fetch_ms": round(self.total_fetch_ms / self.misses, 1) if self.misses else 0.0
+            }
+
+    def _window_start(self) -> date:
+        """Returns the first day of the oldest cached month."""
+        today = date.today()
+        month_index = today.year * 12 + today.month - 1 - (self.months - 1)
+        return date(month_index // 12, month_index % 12 + 1, 1)
+
+    def _is_cached(self, start_date) -> bool:
+        """Tells whether a range starting at `start_date` is inside the cached window."""
+        return not self.months or pd.Timestamp(start_date).date() >= self._window_start()
+
+    def _count_range_query(self) -> None:
+        with self._lock:
+            self.range_queries += 1
+
+    @staticmethod
+    def _iso_date(value) -> str:
+        return pd.Timestamp(value).date().isoformat()
+
+    @staticmethod
+    def _summary_totals(summary: dict) -> dict[str, pd.DataFrame]:
+        """Converts the rows of `get_transaction_summary` (per currency) to the frames of `get_totals`."""
+        daily_df = pd.DataFrame(summary["daily_totals"], columns=["date", "category_type", "currency", "amount", "count"])
+        type_df = pd.DataFrame(summary["type_totals"], columns=["category_type", "currency", "amount", "count"])
+        category_df = pd.DataFrame(summary["category_totals"], columns=["category_type", "category_name", "currency", "amount", "count"])
+
+        daily_totals = daily_df.astype({"amount": float}).groupby("date", as_index=False)[["amount", "count"]].sum()
+        daily_totals["date"] = pd.to_datetime(daily_totals["date"])
+
+        return {
+            "daily_totals": daily_totals,
+            "type_totals": type_df.astype({"amount": float}).groupby("category_type", as_index=False)[["amount", "count"]].sum(),
+            "category_totals": category_df.astype({"amount": float}).groupby(["category_type", "category_name"], as_index=False)[["amount", "count"]].sum()
+        }
+
+    @staticmethod
+    def _load_frame(user_id: int, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        transactions_df = pd.DataFrame(
+            iter_transactions_by_user(user_id, columns=TRANSACTION_COLUMNS, start_date=start_date, end_date=end_date),
+            columns=TRANSACTION_COLUMNS
+        )
+        categories_df = pd.DataFrame(
+            get_categories_table_by_user(user_id),
+            columns=["category_id", "category_type", "category_name"]
+        )
+
+        frame = transactions_df.merge(categories_df, how='inner', on='category_id')[FRAME_COLUMNS]
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame['amount'] = frame['amount'].astype(float)
+
+        return frame.reset_index(drop=True)
+
+# One store per Streamlit process, shared by all sessions and reruns
+dashboard_data = DashboardDataStore(
+    ttl=float(os.environ.get("DASHBOARD_CACHE_TTL", "60")),
+    max_users=int(os.environ.get("DASHBOARD_CACHE_USERS", "256")),
+    months=int(os.environ.get("DASHBOARD_CACHE_MONTHS", "12"))
+)
@@ -0,0 +1,200 @@
+import re
+import time
+import logging
+import threading
+from datetime import date
+from collections import Counter, defaultdict
+
+from cache import TTLCache
+from llm_cache import normalize_user_input
+from llm_tools import TransactionData
+from supabase_api import *
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+_AMOUNT = r"(?P<amount>\d+(?:\.\d{1,2})?)"
+_UNIT = r"(?P<unit>蚊|元|hkd|hk\$|\$|dollars?|bucks)?"
+
+# "<merchant> <amount>" (e.g., "KFC 50", "三哥46", "MTR 12蚊")
+MERCHANT_AMOUNT_PATTERN = re.compile(rf"^(?P<merchant>\D+?)\s*{_AMOUNT}\s*{_UNIT}$", re.IGNORECASE)
+# "<amount>蚊 <item>" (e.g., "50蚊 午餐", "$30 coffee")
+AMOUNT_MERCHANT_PATTERN = re.compile(rf"^\$?{_AMOUNT}\s*{_UNIT}\s+(?P<merchant>\D+)$", re.IGNORECASE)
+
+# Units that name the Hong Kong dollar, other units ("$", "元", ...) are in the user's default currency
+HKD_UNITS = ("蚊", "hkd", "hk$")
+
+# Inputs with a relative date, another currency or a refund are left to the LLM
+FALLBACK_WORDS = (
+    "琴日", "尋日", "昨日", "昨天", "前日", "前天", "聽日", "明日", "上星期", "上個", "禮拜", "星期", "號",
+    "yesterday", "tomorrow", "last", "ago", "usd", "rmb", "jpy", "twd", "sgd", "eur", "gbp", "refund"
+)
+
+def merchant_keys(description: str) -> set[str]:
+    """
+    Returns the dictionary keys of a transaction description: the normalized description and its first word.
+
+    Example:
+        >>> merchant_keys("三哥 (TamJai SamGor)")
+        >>> {'三哥 (tamjai samgor)', '三哥'}
+    """
+    normalized = normalize_user_input(description or "")
+    if not normalized:
+        return set()
+
+    first_word = re.split(r"[\s(（]", normalized, maxsplit=1)[0]
+    return {normalized, first_word} if first_word else {normalized}
+
+class FastPathExtractor:
+    """
+    Parses simple inputs ("<merchant> <amount>", "<amount>蚊 <item>") without the LLM.
+
+    The category is looked up in a merchant -> category dictionary learned from the
+    user's saved transactions. A TransactionData is only returned when the merchant
+    was saved with the same category often enough, otherwise None (use the LLM).
+    """
+
+    def __init__(self, min_confidence: float = 0.8, min_support: int = 2, dictionary_ttl: float = 3600):
+        """
+        Args:
+            min_confidence (float): Minimum share of the merchant's transactions in the chosen category.
+            min_support (int): Minimum number of saved transactions of the merchant.
+            dictionary_ttl (float): Seconds a user's merchant dictionary is kept before it is learned again.
+        """
+        self.min_confidence = min_confidence
+        self.min_support = min_support
+        self._dictionaries = TTLCache(max_size=10000, ttl=dictionary_ttl)
+        self._lock = threading.Lock()
+
+        self.attempts = 0
+        self.hits = 0
+        self._fast_path_time = 0.0
+        self._fallback_time = 0.0
+        self._fallback_count = 0
+
+    @staticmethod
+    def tokenize(user_input: str) -> tuple[str, float, str] | None:
+        """
+        Splits a simple input into (merchant, amount, unit).
+
+        Returns:
+            tuple: The merchant, amount and unit (may be None), or None if the input is not simple.
+
+        Example:
+            >>> FastPathExtractor.tokenize("三哥46")
+            >>> ('三哥', 46.0, None)
+        """
+        text = " ".join(user_input.split())
+        lowered = text.casefold()
+        if any(word in lowered for word in FALLBACK_WORDS):
+            return None
+
+        match = MERCHANT_AMOUNT_PATTERN.match(text) or AMOUNT_MERCHANT_PATTERN.match(text)
+        if match is None:
+            return None
+
+        merchant = match.group("merchant").strip(" $")
+        if not merchant:
+            return None
+
+        return merchant, float(match.group("amount")), match.group("unit")
+
+    def _load_dictionary(self, user_id: int) -> dict:
+        """Learns the merchant -> Counter(category_id) dictionary of a user from the saved transactions."""
+        dictionary = defaultdict(Counter)
+        for record in get_transaction_descriptions_by_user(user_id):
+            for key in merchant_keys(record["description"]):
+                dictionary[key][record["category_id"]] += 1
+        return dictionary
+
+    def get_dictionary(self, user_id: int) -> dict:
+        return self._dictionaries.get_or_load(str(user_id), lambda: self._load_dictionary(user_id))
+
+    def learn(self, user_id: int, description: str, category_id: int) -> None:
+        """Adds a saved transaction to the user's dictionary (if the dictionary is loaded)."""
+        dictionary = self._dictionaries.get(str(user_id))
+        if dictionary is None or category_id is None:
+            return
+
+        with self._lock:
+            for key in merchant_keys(description):
+                dictionary[key][category_id] += 1
+
+    def extract(self, user_input: str, user_id: int, default_currency: str = None) -> TransactionData | None:
+        """
+        Extracts the transaction of a simple input without the LLM.
+
+        Args:
+            user_input (str): The user's input message.
+            user_id (int): The ID of the user.
+            default_currency (str, optional): The user's default currency, used unless the input names HKD
+                ("蚊", "HKD"). The input is left to the LLM if None.
+
+        Returns:
+            TransactionData: The transaction if the input is simple and the category is confident, otherwise None.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self.attempts += 1
+
+        tokens = self.tokenize(user_input)
+        if tokens is None:
+            return None
+        merchant, amount, unit = tokens
+
+        currency = "HKD" if unit and unit.casefold() in HKD_UNITS else default_currency
+        if not currency:
+            return None
+
+        category_counts = self.get_dictionary(user_id).get(normalize_user_input(merchant))
+        if not category_counts:
+            return None
+
+        with self._lock:
+            category_id, count = category_counts.most_common(1)[0]
+            total = sum(category_counts.values())
+
+        if total < self.min_support or count / total < self.min_confidence:
+            return None
+
+        category = next(
+            (key for key, value in get_user_category_map(user_id).items() if value == category_id),
+            None
+        )
+        if category is None:
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self._fast_path_time += time.perf_counter() - start
+
+        return TransactionData(
+            is_transaction=True,
+            date=date.today().isoformat(),
+            category_type=category[0],
+            category_name=category[1],
+            description=merchant,
+            currency=currency,
+            price=amount
+        )
+
+    def record_fallback_latency(self, seconds: float) -> None:
+        """Records the latency of an extraction that fell back to the LLM."""
+        with self._lock:
+            self._fallback_time += seconds
+            self._fallback_count += 1
+
+    def stats(self) -> dict:
+        """Returns the fast-path hit rate and the estimated latency saved by the fast path."""
+        with self._lock:
+            attempts, hits = self.attempts, self.hits
+            avg_fallback = self._fallback_time / self._fallback_count if self._fallback_count else 0.0
+            avg_fast_path = self._fast_path_time / hits if hits else 0.0
+
+        return {
+            "attempts": attempts,
+            "hits": hits,
+            "hit_rate": round(hits / attempts, 4) if attempts else 0.0,
+            "avg_fast_path_ms": round(avg_fast_path * 1000, 3),
+            "avg_fallback_ms": round(avg_fallback * 1000, 3),
+            "latency_saved_s": round(hits * max(avg_fallback - avg_fast_path, 0.0), 3)
+        }
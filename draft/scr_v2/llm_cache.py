@@ -0,0 +1,109 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+
+from cache import TTLCache
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+def normalize_user_input(user_input: str) -> str:
+    """
+    Normalizes a user input for cache lookups (full-width characters, case and whitespace).
+
+    Example:
+        >>> normalize_user_input("  ＫＦＣ   50 ")
+        >>> 'kfc 50'
+    """
+    return " ".join(unicodedata.normalize("NFKC", user_input).casefold().split())
+
+class ExtractionCache:
+    """
+    Caches LLM extraction results by normalized user input, user categories and date.
+
+    Results are kept in a bounded in-memory LRU cache with a TTL, and optionally in a
+    SQLite file so that they survive restarts.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 86400, db_path: str = None):
+        """
+        Args:
+            max_size (int): Maximum number of results kept in memory.
+            ttl (float): Seconds a result stays valid.
+            db_path (str, optional): Path of the SQLite file of the on-disk cache. Memory only if None.
+        """
+        self.ttl = ttl
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    @staticmethod
+    def make_key(user_input: str, user_categories: list[tuple[str, str]], current_date: str) -> str:
+        """
+        Builds the cache key of an extraction.
+
+        The date is part of the key because relative dates (e.g., 琴日) depend on the day,
+        and the categories because the LLM can only answer with the user's categories.
+        """
+        key_data = json.dumps(
+            [normalize_user_input(user_input), sorted(user_categories), current_date],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """Returns a copy of the cached result of `key`, or None on a miss."""
+        value = self.memory.get(key)
+
+        if value is None and self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value FROM llm_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+            if row is not None:
+                value = json.loads(row[0])
+                self.memory.set(key, value)
+                self.disk_hits += 1
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return dict(value)
+
+    def set(self, key: str, value: dict) -> None:
+        """Caches the result of `key`."""
+        self.memory.set(key, dict(value))
+
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl)
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Returns the hit / miss counters and the memory cache size."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / (self.hits + self.misses), 4) if (self.hits + self.misses) else 0.0,
+            "memory_size": len(self.memory)
+        }
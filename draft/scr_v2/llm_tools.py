@@ -8,9 +8,11 @@ from pydantic import BaseModel, Field
 from langchain_perplexity import ChatPerplexity
 from langchain_deepseek import ChatDeepSeek
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
 
 from utils import *
 from supabase_api import *
+from llm_cache import ExtractionCache
 
 logger = logging.getLogger(f'flask_app.{__name__}')
 
@@ -25,16 +27,36 @@ class TransactionData(BaseModel):
     currency: Optional[str] = Field("HKD", description="The currency of the transaction (e.g., USD, HKD, TWD). Should be None if not a transaction.")
     price: Optional[float] = Field(description="Price of the transaction (must be a number). Should be None if not a transaction.")
 
+class BatchTransactionData(TransactionData):
+    """Features of one numbered input of a batch."""
+
+    index: int = Field(description="The number of the input line the transaction is extracted from.")
+
+class TransactionBatch(BaseModel):
+    """Feature formatter to extract one transaction for each numbered input line."""
+
+    transactions: list[BatchTransactionData] = Field(description="One entry for each numbered input line, in the same order.")
+
 @log_function(logger)
 class TransactionExtractorLLM:
     """A class to interact with the Perplexity LLM for transaction data extraction."""
 
     ### "deepseek-chat" / "sonar"
-    def __init__(self, model_name: str = "sonar", temperature: float = 0.0):
+    def __init__(
+        self,
+        model_name: str = "sonar",
+        temperature: float = 0.0,
+        llm: BaseChatModel = None,
+        cache: ExtractionCache = None
+    ):
         self.model_name = model_name
         self.temperature = temperature
+        self.cache = cache
 
-        if model_name in ["sonar", "sonar-pro", "llama-3.1-sonar-small-128k-online"]:
+        if llm is not None:
+            # Use the given chat model (e.g., a stub model in benchmarks)
+            self.llm = llm
+        elif model_name in ["sonar", "sonar-pro", "llama-3.1-sonar-small-128k-online"]:
             os.environ["PPLX_API_KEY"] = config.PERPLEXITY_API_KEY
 
             # Use Perplexity's Sonar model
@@ -47,6 +69,10 @@ class TransactionExtractorLLM:
 
         self.prompt = self._create_prompt_template()
 
+        # Build the structured output chain once, it is reused by every extraction
+        self.chain = self.prompt | self.llm.with_structured_output(TransactionData)
+        self.batch_chain = self.prompt | self.llm.with_structured_output(TransactionBatch)
+
     def _create_prompt_template(self):
         """Loads the system prompt from an external file and creates the ChatPromptTemplate."""
         prompt_path = Path(__file__).parent / "prompts" / "bookkeeping_system_prompt.txt"
@@ -90,16 +116,82 @@ class TransactionExtractorLLM:
                 "price": 150.0
             }
         """
-        # Chain the prompt with the LLM and the structured output parser
-        structured_llm = self.llm.with_structured_output(TransactionData)
-        chain = self.prompt | structured_llm
+        current_date = date.today().isoformat()
+        user_categories = get_user_categories_info(user_id)
+
+        # Repeated inputs (e.g., "KFC 50") are answered from the cache
+        if self.cache is not None:
+            cache_key = self.cache.make_key(user_input, user_categories, current_date)
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
 
         # Invoke the chain with the user message and current date
-        response_model = chain.invoke({
+        response_model = self.chain.invoke({
             "user_message": user_input,
-            "current_date": date.today().isoformat(),
-            "user_categories": get_user_categories_info(user_id)
+            "current_date": current_date,
+            "user_categories": user_categories
+        })
+        response = response_model.model_dump()
+
+        if self.cache is not None:
+            self.cache.set(cache_key, response)
+
+        return response
+        
+
+    @log_function(logger)
+    def extract_bookkeeping_features_batch(self, user_inputs: list[str], user_id: int) -> list[dict | None]:
+        """
+        Extracts the bookkeeping features of many inputs with one LLM call.
+
+        Args:
+            user_inputs (list[str]): The user's input messages, one transaction each.
+            user_id (int): The ID of the user, used to fetch user-specific categories.
+
+        Returns:
+            list[dict | None]: The extracted transaction data of each input (same order),
+            None for an input the LLM did not answer.
+
+        Example:
+            >>> extractor.extract_bookkeeping_features_batch(["早餐 30", "的士 80"], 12345)
+            >>> [{"is_transaction": True, ..., "price": 30.0}, {"is_transaction": True, ..., "price": 80.0}]
+        """
+        current_date = date.today().isoformat()
+        user_categories = get_user_categories_info(user_id)
+
+        responses = [None] * len(user_inputs)
+        cache_keys = [None] * len(user_inputs)
+
+        # Inputs already in the cache are not sent to the LLM
+        if self.cache is not None:
+            for i, user_input in enumerate(user_inputs):
+                cache_keys[i] = self.cache.make_key(user_input, user_categories, current_date)
+                responses[i] = self.cache.get(cache_keys[i])
+
+        pending = [i for i, response in enumerate(responses) if response is None]
+        if not pending:
+            return responses
+
+        # Number the inputs so the LLM can return the index of each transaction
+        user_message = "Extract one transaction for each numbered input line below, set index to the line number:\n" + "\n".join(
+            f"{number}. {user_inputs[i]}" for number, i in enumerate(pending, start=1)
+        )
+
+        batch_model = self.batch_chain.invoke({
+            "user_message": user_message,
+            "current_date": current_date,
+            "user_categories": user_categories
         })
 
-        return response_model.model_dump()
-        
\ No newline at end of file
+        for item in batch_model.transactions:
+            if not 1 <= item.index <= len(pending):
+                continue
+
+            i = pending[item.index - 1]
+            responses[i] = item.model_dump(exclude={"index"})
+
+            if self.cache is not None:
+                self.cache.set(cache_keys[i], responses[i])
+
+        return responses
@@ -0,0 +1,53 @@
+"""
+Checks and repairs the monthly rollup table (Monthly_Category_Totals).
+
+The rollup is kept up to date by the `after_transaction_rollup` trigger. This tool
+compares it with totals recomputed from the transactions, and rebuilds it from the
+transactions when they differ (e.g., after a manual data fix with the trigger disabled).
+
+Usage:
+    python rollup_tool.py verify [--user-id USER_ID]
+    python rollup_tool.py rebuild [--user-id USER_ID] [--only-if-inconsistent]
+"""
+import sys
+import argparse
+
+from supabase_api import *
+
+def verify(user_id: int = None) -> int:
+    """Prints the inconsistent rollup rows and returns their number."""
+    mismatches = verify_monthly_rollup(user_id)
+
+    for row in mismatches:
+        print(
+            f"user {row['user_id']} {row['month']} category {row['category_id']} {row['currency']}: "
+            f"rollup {row['rollup_amount']} ({row['rollup_count']} rows), "
+            f"transactions {row['actual_amount']} ({row['actual_count']} rows)"
+        )
+
+    scope = f"user {user_id}" if user_id is not None else "all users"
+    print(f"{len(mismatches)} inconsistent rollup rows for {scope}")
+    return len(mismatches)
+
+def rebuild(user_id: int = None, only_if_inconsistent: bool = False) -> int:
+    """Rebuilds the rollup, then verifies it. Returns the number of rows still inconsistent."""
+    if only_if_inconsistent and verify(user_id) == 0:
+        return 0
+
+    rows = rebuild_monthly_rollup(user_id)
+    print(f"Rebuilt {rows} rollup rows")
+    return verify(user_id)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify or rebuild the monthly rollup table.")
+    parser.add_argument("action", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", type=int, default=None, help="Only this user (default: all users)")
+    parser.add_argument("--only-if-inconsistent", action="store_true", help="rebuild: skip if verify finds nothing")
+    args = parser.parse_args()
+
+    if args.action == "verify":
+        inconsistent = verify(args.user_id)
+    else:
+        inconsistent = rebuild(args.user_id, args.only_if_inconsistent)
+
+    sys.exit(1 if inconsistent else 0)
@@ -0,0 +1,293 @@
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class SessionBackend(ABC):
+    """
+    Storage of the bot sessions shared by the worker processes.
+
+    A session is loaded from the backend when an update of the user starts and
+    written back when it ends, so the next update of the user can be processed by
+    any worker. Sessions are JSON documents and expire `ttl` seconds after their last write.
+
+    The backend also keeps short-lived markers shared by the workers (e.g., the update
+    IDs already received, see `SharedUpdateDeduplicator`).
+    """
+
+    @abstractmethod
+    def load(self, user_id: int) -> dict | None:
+        """Returns the stored session of a user, or None if there is none (or it expired)."""
+
+    @abstractmethod
+    def save(self, user_id: int, session: dict) -> None:
+        """Stores the session of a user."""
+
+    @abstractmethod
+    def delete(self, user_id: int) -> None:
+        """Removes the session of a user."""
+
+    @abstractmethod
+    def add_marker(self, key: str, ttl: float) -> bool:
+        """Sets a marker for `ttl` seconds unless it is already set. Returns True if it was set by this call."""
+
+    @abstractmethod
+    def remove_marker(self, key: str) -> None:
+        """Removes a marker."""
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a SQLite file, shared by the worker processes of one host."""
+
+    def __init__(self, path: str, ttl: float = 3600):
+        """
+        Args:
+            path (str): Path of the SQLite file.
+            ttl (float): Seconds a session is kept after its last write.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+
+        connection = self._connection()
+        # WAL lets the workers read while another one writes
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (user_id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE TABLE IF NOT EXISTS markers (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+        connection.execute("DELETE FROM markers WHERE expires_at <= ?", (time.time(),))
+        connection.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (dispatcher workers run in parallel)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, user_id: int) -> dict | None:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE user_id = ? AND expires_at > ?", (str(user_id), time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save(self, user_id: int, session: dict) -> None:
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, data, expires_at) VALUES (?, ?, ?)",
+            (str(user_id), json.dumps(session, ensure_ascii=False), time.time() + self.ttl)
+        )
+        connection.commit()
+
+    def delete(self, user_id: int) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM sessions WHERE user_id = ?", (str(user_id),))
+        connection.commit()
+
+    def add_marker(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        connection = self._connection()
+        # One transaction, so two workers cannot both set the marker
+        with connection:
+            connection.execute("DELETE FROM markers WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = connection.execute("INSERT OR IGNORE INTO markers (key, expires_at) VALUES (?, ?)", (key, now + ttl))
+        return cursor.rowcount == 1
+
+    def remove_marker(self, key: str) -> None:
+        connection = self._connection()
+        connection.execute("DELETE FROM markers WHERE key = ?", (key,))
+        connection.commit()
+
+class RedisError(Exception):
+    """Raised when the Redis server answers with an error reply."""
+
+class RedisSessionBackend(SessionBackend):
+    """
+    Sessions in Redis (or any server speaking the Redis protocol), shared by the workers of many hosts.
+
+    Uses a minimal RESP client over a socket (GET / SET EX NX / DEL only), so no Redis
+    client package is needed.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        password: str = None,
+        ttl: float = 3600,
+        key_prefix: str = "bookkeeping:session:",
+        marker_prefix: str = "bookkeeping:marker:",
+        timeout: float = 5
+    ):
+        """
+        Args:
+            host (str): Redis host.
+            port (int): Redis port.
+            db (int): Redis database number.
+            password (str, optional): Password sent with AUTH.
+            ttl (float): Seconds a session is kept after its last write.
+            key_prefix (str): Prefix of the session keys.
+            marker_prefix (str): Prefix of the marker keys.
+            timeout (float): Socket timeout in seconds.
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.marker_prefix = marker_prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionBackend":
+        """
+        Creates the backend from a redis:// URL.
+
+        Example:
+            >>> RedisSessionBackend.from_url("redis://:secret@localhost:6379/0")
+        """
+        parsed = urlparse(url)
+        return cls(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            **kwargs
+        )
+
+    def load(self, user_id: int) -> dict | None:
+        data = self.execute("GET", self._key(user_id))
+        return json.loads(data) if data is not None else None
+
+    def save(self, user_id: int, session: dict) -> None:
+        self.execute("SET", self._key(user_id), json.dumps(session, ensure_ascii=False), "EX", str(max(int(self.ttl), 1)))
+
+    def delete(self, user_id: int) -> None:
+        self.execute("DEL", self._key(user_id))
+
+    def add_marker(self, key: str, ttl: float) -> bool:
+        # Not retried: if the first SET landed, a second one answers nil and a new marker would read as already set
+        return self.execute("SET", f"{self.marker_prefix}{key}", "1", "NX", "EX", str(max(int(ttl), 1)), idempotent=False) == "OK"
+
+    def remove_marker(self, key: str) -> None:
+        self.execute("DEL", f"{self.marker_prefix}{key}")
+
+    def execute(self, *args: str, idempotent: bool = True):
+        """
+        Sends one command and returns its reply.
+
+        If the connection is lost (or times out), it is reopened and an idempotent command
+        is sent once more. Other commands (e.g., SET NX) may have been applied before the
+        connection was lost, so the error is raised instead of sending them again.
+
+        Args:
+            *args (str): The command and its arguments.
+            idempotent (bool): Whether sending the command twice has the same effect as once.
+        """
+        try:
+            return self._execute(*args)
+        except (ConnectionError, OSError):
+            self._close()
+            if not idempotent:
+                raise
+            logger.warning("Redis connection lost, reconnecting")
+            return self._execute(*args)
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}{user_id}"
+
+    def _execute(self, *args: str):
+        stream = self._stream()
+        stream.write(self._encode(args))
+        stream.flush()
+        return self._read_reply(stream)
+
+    def _stream(self):
+        # One connection per thread (dispatcher workers run in parallel)
+        stream = getattr(self._local, "stream", None)
+        if stream is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            stream = sock.makefile("rwb")
+            self._local.socket, self._local.stream = sock, stream
+
+            if self.password:
+                self._execute("AUTH", self.password)
+            if self.db:
+                self._execute("SELECT", str(self.db))
+        return stream
+
+    def _close(self) -> None:
+        for name in ("stream", "socket"):
+            resource = getattr(self._local, name, None)
+            if resource is not None:
+                try:
+                    resource.close()
+                except OSError:
+                    pass
+                setattr(self._local, name, None)
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg.encode("utf-8") if isinstance(arg, str) else bytes(arg)
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self, stream):
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            raise RedisError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = stream.read(length + 2)
+            return data[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(payload)
+            return None if length == -1 else [self._read_reply(stream) for _ in range(length)]
+
+        raise RedisError(f"Unknown reply: {line!r}")
+
+def create_session_backend(kind: str, sqlite_path: str = None, redis_url: str = None, ttl: float = 3600) -> SessionBackend | None:
+    """
+    Creates the session backend set in the config.
+
+    Args:
+        kind (str): "memory" (sessions stay in the process, no backend), "sqlite" or "redis".
+        sqlite_path (str, optional): Path of the SQLite file ("sqlite").
+        redis_url (str, optional): redis:// URL of the server ("redis").
+        ttl (float): Seconds a session is kept after its last write.
+
+    Returns:
+        SessionBackend: The backend, or None for "memory".
+    """
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SQLiteSessionBackend(sqlite_path, ttl=ttl)
+    if kind == "redis":
+        return RedisSessionBackend.from_url(redis_url, ttl=ttl)
+
+    raise ValueError(f"Unknown session backend: {kind}")
@@ -0,0 +1,167 @@
+import sys
+import math
+import time
+from datetime import date
+from enum import Enum
+
+class SessionOption(str, Enum):
+    """The input the bot waits for from a user (the `option` of a session)."""
+    REGISTER_USERNAME = "REGISTER_username"
+    REGISTER_CURRENCY = "REGISTER_currency"
+    TRANSACTION_DATE = "TRANSACTION_date"
+    TRANSACTION_CATEGORY_TYPE = "TRANSACTION_category_type"
+    TRANSACTION_CATEGORY_NAME = "TRANSACTION_category_name"
+    TRANSACTION_DESCRIPTION = "TRANSACTION_description"
+    TRANSACTION_CURRENCY = "TRANSACTION_currency"
+    TRANSACTION_AMOUNT = "TRANSACTION_amount"
+
+def _intern(value):
+    # Currencies and category names repeat across users, keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+class PendingTransaction:
+    """A parsed transaction the user is reviewing before it is saved."""
+
+    __slots__ = ("user_id", "date", "category_id", "category_type", "category_name", "description", "currency", "amount")
+
+    def __init__(
+        self,
+        user_id: int,
+        date: str,
+        category_id: int,
+        category_type: str,
+        category_name: str,
+        description: str,
+        currency: str,
+        amount: float
+    ):
+        self.user_id = user_id
+        self.date = date
+        self.category_id = category_id
+        self.category_type = _intern(category_type)
+        self.category_name = _intern(category_name)
+        self.description = description
+        self.currency = _intern(currency)
+        self.amount = amount
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PendingTransaction":
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def validation_errors(self) -> list[str]:
+        """
+        Returns why the Transactions table would reject the row (empty if it can be saved).
+
+        Mirrors the table constraints: category_id, user_id, date and currency NOT NULL,
+        date a valid date, amount NUMERIC(12, 2) with CHECK (amount > 0), currency VARCHAR(3).
+
+        Example:
+            >>> PendingTransaction(1, "2025-07-01", None, "Expense", "Fod", "KFC", "HKD", "-5").validation_errors()
+            >>> ['The category Expense / Fod does not exist', 'The amount -5 must be greater than 0']
+        """
+        errors = []
+
+        if self.user_id is None:
+            errors.append("The user is not registered")
+
+        if self.category_id is None:
+            errors.append(f"The category {self.category_type} / {self.category_name} does not exist")
+
+        try:
+            date.fromisoformat(str(self.date))
+        except ValueError:
+            errors.append(f"The date {self.date} is not a valid date (YYYY-MM-DD)")
+
+        try:
+            amount = float(self.amount)
+        except (TypeError, ValueError):
+            errors.append(f"The amount {self.amount} is not a number")
+        else:
+            if not math.isfinite(amount):
+                errors.append(f"The amount {self.amount} is not a number")
+            elif round(amount, 2) <= 0:
+                errors.append(f"The amount {self.amount} must be greater than 0")
+            elif round(amount, 2) >= 10 ** 10:
+                errors.append(f"The amount {self.amount} is too large")
+
+        if not self.currency or len(self.currency) > 3:
+            errors.append(f"The currency {self.currency} must be a 3-letter code (e.g., HKD)")
+
+        return errors
+
+    def to_row(self) -> dict:
+        """
+        Returns the transaction as a row of the transactions table.
+
+        Example:
+            >>> pending_transaction.to_row()
+            >>> {'user_id': 1, 'date': '2025-07-01', 'category_id': 16, 'description': 'KFC', 'currency': 'HKD', 'amount': 50.0}
+        """
+        return {
+            "user_id": self.user_id,
+            "date": self.date,
+            "category_id": self.category_id,
+            "description": self.description,
+            "currency": self.currency,
+            "amount": self.amount
+        }
+
+class UserSession:
+    """The bot session of a user: profile, pending input option and the transaction being reviewed."""
+
+    __slots__ = ("username", "default_currency", "_option", "option_set_at", "temp_transaction", "message_id")
+
+    def __init__(
+        self,
+        username: str = None,
+        default_currency: str = None,
+        option: SessionOption = None,
+        temp_transaction: PendingTransaction = None,
+        message_id: int = None
+    ):
+        self.username = username
+        self.default_currency = _intern(default_currency)
+        self.option = option
+        self.temp_transaction = temp_transaction
+        self.message_id = message_id
+
+    @property
+    def option(self) -> SessionOption | None:
+        return self._option
+
+    @option.setter
+    def option(self, option: SessionOption | None) -> None:
+        # The time the state was entered, for the conversation state timeouts
+        self._option = option
+        self.option_set_at = time.time() if option is not None else None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserSession":
+        """Creates a session from its `to_dict` form (e.g., read from a session backend)."""
+        session = cls(
+            username=data.get("username"),
+            default_currency=data.get("default_currency"),
+            option=SessionOption(data["option"]) if data.get("option") else None,
+            temp_transaction=PendingTransaction.from_dict(data["temp_transaction"]) if data.get("temp_transaction") else None,
+            message_id=data.get("message_id")
+        )
+        if session.option is not None:
+            session.option_set_at = data.get("option_set_at")
+        return session
+
+    def to_dict(self) -> dict:
+        """Returns the session as a JSON-serializable dict."""
+        return {
+            "username": self.username,
+            "default_currency": self.default_currency,
+            "option": self.option.value if self.option is not None else None,
+            "option_set_at": self.option_set_at,
+            "temp_transaction": self.temp_transaction.to_dict() if self.temp_transaction is not None else None,
+            "message_id": self.message_id
+        }
+
+    def __repr__(self) -> str:
+        return f"UserSession({self.to_dict()})"
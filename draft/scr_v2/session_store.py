@@ -0,0 +1,171 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from session_models import UserSession
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class SessionStore:
+    """
+    Bounded store of the per-chat bot sessions (the former global `user_settings` dict).
+
+    Sessions not used for `idle_ttl` seconds expire, and when more than `max_size`
+    sessions are kept the least recently used one is evicted. A missing, expired or
+    evicted session is loaded again with `loader(user_id)` on the next access, so
+    `store[user_id]` always returns a session.
+
+    With a shared `backend` (see session_backends.py), `begin` loads the session of the
+    user from the backend when an update starts and `commit` writes it back when it
+    ends, so the updates of a user can be processed by any worker process.
+    """
+
+    def __init__(self, loader, max_size: int = 10000, idle_ttl: float = 3600, backend=None):
+        """
+        Args:
+            loader (callable): Function called as loader(user_id) that returns a new UserSession.
+            max_size (int): Maximum number of sessions kept.
+            idle_ttl (float): Seconds a session is kept after its last access.
+            backend (SessionBackend, optional): Shared session storage. Sessions stay in this process if None.
+        """
+        self.loader = loader
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __getitem__(self, user_id: int) -> UserSession:
+        session = self._get(user_id)
+        return session if session is not None else self.load(user_id)
+
+    def __setitem__(self, user_id: int, session: UserSession) -> None:
+        with self._lock:
+            self._sessions[user_id] = [time.monotonic(), session]
+            self._sessions.move_to_end(user_id)
+            self._evict()
+
+    def __delitem__(self, user_id: int) -> None:
+        with self._lock:
+            self._sessions.pop(user_id, None)
+
+    def __contains__(self, user_id: int) -> bool:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            return entry is not None and time.monotonic() - entry[0] < self.idle_ttl
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __repr__(self) -> str:
+        return f"SessionStore(size={len(self._sessions)}, max_size={self.max_size}, idle_ttl={self.idle_ttl})"
+
+    def load(self, user_id: int) -> UserSession:
+        """
+        Loads a new session of a user with the loader and stores it.
+
+        Example:
+            >>> user_settings.load(123456789)
+            >>> UserSession({'username': 'john_doe', 'default_currency': 'HKD', 'option': None, 'temp_transaction': None, 'message_id': None})
+        """
+        session = self.loader(user_id)
+        self[user_id] = session
+
+        with self._lock:
+            self.loads += 1
+
+        return session
+
+    def begin(self, user_id: int) -> UserSession:
+        """
+        Returns the session of a user at the start of an update.
+
+        With a backend the stored session is loaded (another worker may have changed it),
+        otherwise the session kept in this process is used.
+        """
+        if self.backend is None:
+            return self[user_id]
+
+        try:
+            data = self.backend.load(user_id)
+        except Exception:
+            logger.exception(f"Failed to load the session of user {user_id}, using the local one")
+            return self[user_id]
+
+        if data is None:
+            return self.load(user_id)
+
+        session = UserSession.from_dict(data)
+        self[user_id] = session
+        return session
+
+    def commit(self, user_id: int) -> None:
+        """Writes the session of a user back to the backend at the end of an update (no-op without a backend)."""
+        if self.backend is None:
+            return
+
+        session = self._get(user_id)
+        if session is None:
+            return
+
+        try:
+            self.backend.save(user_id, session.to_dict())
+        except Exception:
+            logger.exception(f"Failed to save the session of user {user_id}")
+
+    def stats(self) -> dict:
+        """Returns the number of sessions and the hit / load / eviction / expiration counters."""
+        with self._lock:
+            self._expire()
+            return {
+                "backend": type(self.backend).__name__ if self.backend is not None else "memory",
+                "size": len(self._sessions),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def _get(self, user_id: int) -> UserSession | None:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+
+            now = time.monotonic()
+            if now - entry[0] >= self.idle_ttl:
+                del self._sessions[user_id]
+                self.expirations += 1
+                return None
+
+            entry[0] = now
+            self._sessions.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def _evict(self) -> None:
+        """Drops the expired sessions and the least recently used ones over `max_size` (lock held)."""
+        self._expire()
+
+        while len(self._sessions) > self.max_size:
+            user_id, _ = self._sessions.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"Evicted the session of user {user_id}")
+
+    def _expire(self) -> None:
+        # The least recently used sessions are first, stop at the first one still in use
+        now = time.monotonic()
+        while self._sessions:
+            user_id, entry = next(iter(self._sessions.items()))
+            if now - entry[0] < self.idle_ttl:
+                break
+            del self._sessions[user_id]
+            self.expirations += 1
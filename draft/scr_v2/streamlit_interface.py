@@ -1,6 +1,8 @@
+import time
 import streamlit as st
 import pandas as pd
 from supabase_api import *
+from dashboard_data import dashboard_data
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta, date
@@ -17,9 +19,11 @@ with set_page_width():
     # Get query parameters
     query_params = st.query_params
 
+    render_start = time.perf_counter()
+
     if query_params:
         user_id = query_params.get("user_id", "")
-        user_info = get_user_info(user_id)
+        user_info = dashboard_data.get_user_info(user_id)
     else:
         user_id = None
 
@@ -27,19 +31,6 @@ with set_page_width():
         st.title("Financial Dashboard")
         st.subheader(f"Welcome, {user_info['username']}!!!")
 
-        # Fetch data
-        transactions_data = get_transactions_table_by_user(user_id)
-        categories_data = get_categories_table_by_user(user_id)
-
-        transactions_df = pd.DataFrame(transactions_data)
-        categories_df = pd.DataFrame(categories_data)
-
-        # Process data
-        transactions_df = transactions_df[["created_at", "updated_at", "date", "category_id", "description", "currency", "amount"]]
-        merge_df = transactions_df.merge(categories_df, how='inner', on='category_id')
-        merge_df = merge_df[["created_at", "updated_at", "date", "category_type", "category_name", "description", "currency", "amount"]]
-        merge_df['date'] = pd.to_datetime(merge_df['date'])
-
         # ==============================================================================================
         # Date filter
         st.subheader("Select Transactions by Date")
@@ -51,20 +42,26 @@ with set_page_width():
             end_date = st.date_input(label="End Date", value=first_day_of_this_month+relativedelta(months=1)-timedelta(days=1))
 
         # ==============================================================================================
-        # Filter dataframe by date range
-        mask = (merge_df['date'].dt.date >= start_date) & (merge_df['date'].dt.date <= end_date)
-        transaction_df = merge_df[mask]
+        # Transactions of the user are cached, changing the dates only slices the cached data
+        transaction_df = dashboard_data.get_transactions(user_id, start_date, end_date)
 
         # Display transaction history
         with st.expander("Transaction History"):
             st.dataframe(transaction_df.sort_values(by='date', ascending=False))
 
-        st.dataframe(transaction_df.groupby("date")["amount"].sum().reset_index())
+        # ==============================================================================================
+        # Totals of the selected dates (vectorized over the cached date-sorted arrays)
+        totals = dashboard_data.get_totals(user_id, start_date, end_date)
+        daily_totals_df = totals["daily_totals"][["date", "amount"]]
+        type_totals_df = totals["type_totals"]
+        category_totals_df = totals["category_totals"]
+
+        st.dataframe(daily_totals_df)
 
         # ==============================================================================================
         # Create line chart with Plotly Express
         fig = px.line(
-            data_frame=transaction_df.groupby("date")["amount"].sum().reset_index(),
+            data_frame=daily_totals_df,
             x='date',
             y='amount',
             title='Daily Spending Trend',
@@ -88,7 +85,7 @@ with set_page_width():
         with col1:
             # Create pie chart
             fig = px.pie(
-                data_frame=transaction_df,
+                data_frame=type_totals_df,
                 values='amount',
                 names='category_type',
                 title='Income VS Expense',
@@ -101,7 +98,7 @@ with set_page_width():
         with col2:
             # Create pie chart
             fig = px.pie(
-                data_frame=transaction_df,
+                data_frame=category_totals_df,
                 values='amount',
                 names='category_name',
                 title='Spending in each category',
@@ -112,6 +109,14 @@ with set_page_width():
             # Display in Streamlit
             st.plotly_chart(fig)
 
+        # ==============================================================================================
+        # Footer: data cache statistics
+        cache_stats = dashboard_data.stats()
+        st.caption(
+            f"Rendered in {(time.perf_counter() - render_start) * 1000:.0f} ms · "
+            f"cache hits {cache_stats['hits'] + cache_stats['revalidations']} / misses {cache_stats['misses']} · "
+            f"last fetch {cache_stats['last_fetch_ms']} ms"
+        )
 
     else:
         st.error("Please provide a valid user_id to view the dashboard.")
\ No newline at end of file
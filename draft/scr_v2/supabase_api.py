@@ -1,5 +1,8 @@
 import os
+import atexit
 from supabase import create_client
+from cache import TTLCache
+from write_behind import ProfileUpdateCoalescer
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -8,6 +11,20 @@ url= os.environ.get("SUPABASE_URL")
 key= os.environ.get("SUPABASE_KEY")
 supabase = create_client(url, key)
 
+# Per-user {(category_type, category_name): category_id} maps
+category_cache = TTLCache(
+    max_size=int(os.environ.get("CATEGORY_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("CATEGORY_CACHE_TTL", "600"))
+)
+
+# Per-user, per-month summaries read from the monthly rollup
+# Per process: only the worker that flushed the new rows invalidates its entries,
+# other workers serve theirs until the TTL, so keep it short with many workers
+monthly_summary_cache = TTLCache(
+    max_size=int(os.environ.get("MONTHLY_SUMMARY_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("MONTHLY_SUMMARY_CACHE_TTL", "3600"))
+)
+
 def get_transactions_table_by_user(user_id:int):
     response = (
         supabase.table("transactions")
@@ -18,6 +35,207 @@ def get_transactions_table_by_user(user_id:int):
 
     return response.data if response.data else None
 
+def iter_transactions_by_user(
+    user_id: int,
+    columns: list[str] = ("date", "category_id", "description", "currency", "amount"),
+    start_date: str = None,
+    end_date: str = None,
+    page_size: int = 1000,
+    include_deleted: bool = False
+):
+    """
+    Stream the transactions of a user page by page, only fetching the given columns.
+
+    Pages are read with keyset pagination on (date, transaction_id), so each page is an
+    index range scan and memory stays flat however long the user's history is.
+
+    Args:
+        user_id (int): The user's unique identifier.
+        columns (list[str]): The columns to return.
+        start_date (str, optional): First date (ISO format, inclusive), filtered by the database.
+        end_date (str, optional): Last date (ISO format, inclusive), filtered by the database.
+        page_size (int): Number of rows fetched per request.
+        include_deleted (bool): Also return soft-deleted transactions.
+
+    Yields:
+        dict: One transaction with the given columns, ordered by (date, transaction_id).
+
+    Example:
+        >>> for row in iter_transactions_by_user(123456789, ["date", "amount"], start_date="2025-07-01"):
+        >>>     print(row)
+        {"date": "2025-07-01", "amount": 50.0}
+    """
+    # The cursor columns are always fetched
+    select_columns = list(dict.fromkeys([*columns, "date", "transaction_id"]))
+    cursor = None
+
+    while True:
+        query = (
+            supabase.table("transactions")
+            .select(",".join(select_columns))
+            .eq("user_id", user_id)
+        )
+
+        if not include_deleted:
+            query = query.eq("is_deleted", False)
+        if start_date is not None:
+            query = query.gte("date", start_date)
+        if end_date is not None:
+            query = query.lte("date", end_date)
+        if cursor is not None:
+            # Rows after the last row of the previous page
+            query = query.or_(f"date.gt.{cursor['date']},and(date.eq.{cursor['date']},transaction_id.gt.{cursor['transaction_id']})")
+
+        rows = query.order("date").order("transaction_id").limit(page_size).execute().data or []
+
+        for row in rows:
+            yield {column: row[column] for column in columns}
+
+        if len(rows) < page_size:
+            return
+
+        cursor = rows[-1]
+
+def get_transactions_version(user_id: int) -> str | None:
+    """
+    Fetch the latest `updated_at` of a user's transactions (soft-deleted included).
+
+    Inserts, updates and soft deletes all move it forward, so it tells whether data
+    cached for the user is still current with one indexed single-row read.
+
+    Args:
+        user_id (int): The user's unique identifier.
+
+    Returns:
+        str: The latest `updated_at` timestamp, or None if the user has no transactions.
+    """
+    response = (
+        supabase.table("transactions")
+        .select("updated_at")
+        .eq("user_id", user_id)
+        .order("updated_at", desc=True)
+        .limit(1)
+        .execute()
+    )
+
+    return response.data[0]["updated_at"] if response.data else None
+
+def get_transaction_summary(user_id: int, start_date: str, end_date: str) -> dict:
+    """
+    Fetch the totals of a user's transactions in a date range, aggregated by the database
+    (the `get_transaction_summary` function in `Summary Function.sql`).
+
+    Args:
+        user_id (int): The user's unique identifier.
+        start_date (str): First date (ISO format, inclusive).
+        end_date (str): Last date (ISO format, inclusive).
+
+    Returns:
+        dict: Daily totals, per-category totals and income / expense totals.
+
+    Example:
+        >>> get_transaction_summary(123456789, "2025-07-01", "2025-07-31")
+        >>> {
+                "daily_totals": [{"date": "2025-07-01", "category_type": "Expense", "currency": "HKD", "amount": 96.0, "count": 2}, ...],
+                "category_totals": [{"category_type": "Expense", "category_name": "Food", "currency": "HKD", "amount": 1280.5, "count": 31}, ...],
+                "type_totals": [{"category_type": "Expense", "currency": "HKD", "amount": 5230.0, "count": 58}, ...]
+            }
+    """
+    response = supabase.rpc(
+        "get_transaction_summary",
+        {
+            "p_user_id": user_id,
+            "p_start_date": start_date,
+            "p_end_date": end_date
+        }
+    ).execute()
+
+    summary = response.data or {}
+    return {
+        "daily_totals": summary.get("daily_totals", []),
+        "category_totals": summary.get("category_totals", []),
+        "type_totals": summary.get("type_totals", [])
+    }
+
+def get_monthly_summary(user_id: int, month: str) -> dict:
+    """
+    Fetch the totals of one month of a user from the monthly rollup table
+    (the `get_monthly_summary` function in `Monthly Rollup.sql`), one row per category.
+
+    The summary is cached per (user, month) (MONTHLY_SUMMARY_CACHE_TTL seconds), so a
+    repeated request needs no database round-trip. Call `invalidate_monthly_summary`
+    after transactions of the month are saved.
+
+    Args:
+        user_id (int): The user's unique identifier.
+        month (str): Any date of the month (ISO format, e.g., "2025-07" or "2025-07-15").
+
+    Returns:
+        dict: Per-category totals and income / expense totals of the month.
+
+    Example:
+        >>> get_monthly_summary(123456789, "2025-07")
+        >>> {
+                "month": "2025-07-01",
+                "category_totals": [{"category_type": "Expense", "category_name": "Food", "currency": "HKD", "amount": 1280.5, "count": 31}, ...],
+                "type_totals": [{"category_type": "Expense", "currency": "HKD", "amount": 5230.0, "count": 58}, ...]
+            }
+    """
+    month = f"{str(month)[:7]}-01"
+    cache_key = f"{user_id}:{month[:7]}"
+
+    summary = monthly_summary_cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    response = supabase.rpc(
+        "get_monthly_summary",
+        {
+            "p_user_id": user_id,
+            "p_month": month
+        }
+    ).execute()
+
+    data = response.data or {}
+    summary = {
+        "month": month,
+        "category_totals": data.get("category_totals", []),
+        "type_totals": data.get("type_totals", [])
+    }
+    monthly_summary_cache.set(cache_key, summary)
+
+    return summary
+
+def invalidate_monthly_summary(user_id: int, month: str) -> None:
+    """Drop the cached summary of a user's month, must be called after transactions of the month are saved."""
+    monthly_summary_cache.invalidate(f"{user_id}:{str(month)[:7]}")
+
+def verify_monthly_rollup(user_id: int = None) -> list[dict]:
+    """
+    Compare the monthly rollup table with totals recomputed from the transactions.
+
+    Args:
+        user_id (int, optional): Only check this user. All users if None.
+
+    Returns:
+        list[dict]: The rollup rows that differ from the transactions (empty if consistent).
+    """
+    response = supabase.rpc("verify_monthly_rollup", {"p_user_id": user_id}).execute()
+    return response.data or []
+
+def rebuild_monthly_rollup(user_id: int = None) -> int:
+    """
+    Recompute the monthly rollup table from the transactions.
+
+    Args:
+        user_id (int, optional): Only rebuild this user. All users if None.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    response = supabase.rpc("rebuild_monthly_rollup", {"p_user_id": user_id}).execute()
+    return response.data or 0
+
 def get_categories_table_by_user(user_id:int):
     response = (
         supabase.table("categories")
@@ -28,6 +246,52 @@ def get_categories_table_by_user(user_id:int):
 
     return response.data if response.data else None
 
+def get_user_category_map(user_id: int) -> dict[tuple[str, str], int]:
+    """
+    Fetch the categories of a user as a {(category_type, category_name): category_id} map.
+
+    The map is cached per user (CATEGORY_CACHE_TTL seconds), so category lookups on
+    the hot path need no database round-trip. The bot never changes categories;
+    a category added in the database is found at once by `get_category_id` (which
+    reloads the map on a miss), while renamed or deleted categories (and the category
+    list given to the LLM) are stale for at most CATEGORY_CACHE_TTL seconds.
+
+    Args:
+        user_id (int): The user's unique identifier (e.g., 1, 2, 1174923863).
+
+    Returns:
+        dict: The category map of the user.
+
+    Example:
+        >>> get_user_category_map(123456789)
+        >>> {("Income", "Salary"): 1, ("Expense", "Food"): 16, ...}
+    """
+    category_map = category_cache.get(str(user_id))
+    if category_map is not None:
+        return category_map
+
+    response = (
+        supabase.table("categories")
+        .select("category_id, category_type, category_name")
+        .eq("user_id", user_id)
+        .execute()
+    )
+
+    category_map = {
+        (record["category_type"], record["category_name"]): record["category_id"]
+        for record in response.data
+    }
+
+    # Users without categories yet are not cached, their categories may be created any time
+    if category_map:
+        category_cache.set(str(user_id), category_map)
+
+    return category_map
+
+def invalidate_user_categories(user_id: int) -> None:
+    """Drop the cached categories of a user (e.g., after the user's categories are changed)."""
+    category_cache.invalidate(str(user_id))
+
 def get_category_id(cat_type:str, cat_name:str,  user_id:int) -> int:
     """
     Retrieve the category ID from the database based on category type, name, and user ID.
@@ -44,16 +308,14 @@ def get_category_id(cat_type:str, cat_name:str,  user_id:int) -> int:
         >>> get_category_id("expense", "grocery shopping", 123456789)
         >>> 42  # Example category ID
     """
-    response = (
-        supabase.table("categories")
-        .select("category_id")
-        .eq("category_type", cat_type)
-        .eq("category_name", cat_name)
-        .eq("user_id", user_id)
-        .execute()
-    )
+    category_id = get_user_category_map(user_id).get((cat_type, cat_name))
+
+    if category_id is None:
+        # The category may have been added since the map was cached
+        invalidate_user_categories(user_id)
+        category_id = get_user_category_map(user_id).get((cat_type, cat_name))
 
-    return response.data[0]["category_id"] if response.data else None
+    return category_id
 
 def get_user_categories_info(user_id: int) -> list[tuple[str, str]]:
     """
@@ -79,18 +341,30 @@ def get_user_categories_info(user_id: int) -> list[tuple[str, str]]:
         >>>     ...
         >>> ]
     """
-    response = supabase.table("categories") \
-        .select("category_type, category_name") \
-        .eq("user_id", user_id) \
+    return list(get_user_category_map(user_id).keys())
+
+def get_transaction_descriptions_by_user(user_id: int, limit: int = 1000) -> list[dict]:
+    """
+    Fetch the description and category ID of the latest saved transactions of a user.
+
+    Args:
+        user_id (int): The user's unique identifier.
+        limit (int): Maximum number of transactions, latest first.
+
+    Returns:
+        list[dict]: Records like [{"description": "KFC", "category_id": 16}, ...]
+    """
+    response = (
+        supabase.table("transactions")
+        .select("description, category_id")
+        .eq("user_id", user_id)
+        .eq("is_deleted", False)
+        .order("date", desc=True)
+        .limit(limit)
         .execute()
-    
-    # Extract tuples from response
-    categories = [
-        (record["category_type"], record["category_name"])
-        for record in response.data
-    ]
+    )
 
-    return categories
+    return response.data if response.data else []
 
 def transaction_insert(transactions: dict) -> None:
     """Insert a transaction into the Supabase database.
@@ -117,6 +391,38 @@ def transaction_insert(transactions: dict) -> None:
         .execute()
     )
 
+def transactions_bulk_insert(transactions: list[dict]) -> None:
+    """Insert many transactions into the Supabase database with one multi-row insert.
+
+    Rows with a `pending_id` (set by the write buffer) already stored are skipped
+    (ON CONFLICT (pending_id) DO NOTHING), so inserting the same rows again is harmless.
+    
+    Args:
+        transactions (list[dict]): The transactions, same format as `transaction_insert` plus `pending_id`.
+    
+    Returns:
+        None
+    """
+    if not transactions:
+        return
+
+    response = (
+        supabase.table("transactions")
+        .upsert(transactions, on_conflict="pending_id", ignore_duplicates=True)
+        .execute()
+    )
+
+def is_rejected_row_error(error: Exception) -> bool:
+    """
+    Tells if a failed insert was rejected because of the rows themselves, not because of an outage.
+
+    True for the PostgreSQL data exceptions (SQLSTATE 22xxx), constraint violations (23xxx)
+    and the PostgREST request errors (PGRST1xx / PGRST2xx, answered with 4xx). Connection
+    errors and 5xx answers have no such code and are retried.
+    """
+    code = str(getattr(error, "code", None) or "")
+    return code[:2] in ("22", "23") or code.startswith(("PGRST1", "PGRST2"))
+
 def get_user_info(user_id: int) -> dict:
     """
     Fetch user information from the database.
@@ -149,29 +455,46 @@ def get_user_info(user_id: int) -> dict:
     else:
         return None
     
+def user_info_update_fields(user_id: int, fields: dict) -> None:
+    """
+    Update many user information fields in the database with one request.
+
+    Args:
+        user_id (int): The user's unique identifier.
+        fields (dict): The new values by column name (e.g., {"username": "john_doe", "default_currency": "HKD"}).
+    """
+    if not fields:
+        return
+
+    response = (
+        supabase
+        .table("users")
+        .update(fields)
+        .eq("user_id", user_id)
+        .execute()
+    )
+
 def user_info_update(
     user_id: int,
     username: str = None,
     currency: str = None
 ):
-    """Update user information in the database."""
+    """Update user information in the database (one request for all given fields)."""
+    fields = {}
     if username is not None:
-        response = (
-            supabase
-            .table("users")
-            .update({"username": username})
-            .eq("user_id", user_id)
-            .execute()
-        )
-    
+        fields["username"] = username
     if currency is not None:
-        response = (
-            supabase
-            .table("users")
-            .update({"default_currency": currency})
-            .eq("user_id", user_id)
-            .execute()
-        )
+        fields["default_currency"] = currency
+
+    user_info_update_fields(user_id, fields)
+
+# Rapid profile edits of a user are merged into one write
+profile_update_coalescer = ProfileUpdateCoalescer(
+    update_fields=user_info_update_fields,
+    window=float(os.environ.get("USER_UPDATE_WINDOW", "1.0"))
+)
+# Write the edits still waiting for their timer on shutdown
+atexit.register(profile_update_coalescer.flush_all)
 
 if __name__ == "__main__":
 
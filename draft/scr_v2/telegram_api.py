@@ -1,6 +1,91 @@
 import config
 import requests
 import json
+import logging
+from requests.adapters import HTTPAdapter
+from telegram_sender import OutboundSender
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class TelegramClient:
+    """
+    A shared HTTP client for the Telegram Bot API.
+
+    Keeps a pool of keep-alive connections to api.telegram.org, so the messages
+    sent by one update reuse the same TCP/TLS connection instead of opening a new one each.
+    """
+
+    def __init__(
+        self,
+        bot_token: str,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10,
+        pool_maxsize: int = 10
+    ):
+        """
+        Args:
+            bot_token (str): The Telegram bot token.
+            connect_timeout (float): Seconds to wait for a connection to the Bot API.
+            read_timeout (float): Seconds to wait for a Bot API response.
+            pool_maxsize (int): Maximum number of pooled connections per host.
+        """
+        self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self.timeout = (connect_timeout, read_timeout)
+
+        # One connection pool per host, `pool_maxsize` keep-alive connections in it
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+
+    def call(self, method: str, params: dict) -> dict | None:
+        """
+        Calls a Bot API method.
+
+        Args:
+            method (str): The Bot API method (e.g., sendMessage).
+            params (dict): The parameters of the method.
+
+        Returns:
+            dict: The Bot API response json (e.g., {"ok": True, "result": {...}}), or None on network errors.
+        """
+        try:
+            response = self.session.post(f"{self.base_url}/{method}", data=params, timeout=self.timeout)
+            response_json = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Telegram API {method} failed: {e}")
+            return None
+
+        if not response_json.get("ok"):
+            logger.error(f"Telegram API {method} error: {response_json}")
+
+        return response_json
+
+telegram_client = TelegramClient(
+    bot_token=config.TELEGRAM_BOT_TOKEN,
+    connect_timeout=config.TELEGRAM_CONNECT_TIMEOUT,
+    read_timeout=config.TELEGRAM_READ_TIMEOUT,
+    pool_maxsize=config.TELEGRAM_POOL_MAXSIZE
+)
+
+outbound_sender = OutboundSender(
+    client=telegram_client,
+    global_rate=config.TELEGRAM_GLOBAL_RATE,
+    chat_rate=config.TELEGRAM_CHAT_RATE,
+    chat_burst=config.TELEGRAM_CHAT_BURST,
+    max_connections=config.TELEGRAM_POOL_MAXSIZE
+)
+
+def call_telegram_api(chat_id: int, method: str, params: dict):
+    """
+    Sends a Bot API call to a chat, queued on the rate limited sender unless TELEGRAM_SEND_MODE is "sync".
+
+    Returns:
+        Future | dict | None: A Future of the Bot API response json (async mode), or the response json (sync mode).
+    """
+    if config.TELEGRAM_SEND_MODE == "sync":
+        return telegram_client.call(method, params)
+
+    return outbound_sender.enqueue(chat_id, method, params)
 
 def parse_tg_api_respnse_info(api_response: dict) -> tuple:
     """
@@ -38,25 +123,22 @@ def parse_tg_api_respnse_info(api_response: dict) -> tuple:
     
     return update_type, response_info
 
-def SendMessage(tg_user_id:int, message:dict) -> None:
+def SendMessage(tg_user_id:int, message:dict):
     """
     Sends a message to a Telegram chat using the bot API.
     
     Args:
         message (dict): The response from the LLM containing the message to send.
     """
-
-    url = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
-
     params = {
         "chat_id": tg_user_id,
         "text": str(message),
         "parse_mode": "HTML"
     }
 
-    requests.post(url, data=params)
+    return call_telegram_api(tg_user_id, "sendMessage", params)
 
-def SendInlineKeyboardMessage(tg_user_id:int, message:str, keyboard_setting:dict) -> None:
+def SendInlineKeyboardMessage(tg_user_id:int, message:str, keyboard_setting:dict):
     """
     Sends a message with an inline keyboard to a Telegram chat.
 
@@ -80,52 +162,78 @@ def SendInlineKeyboardMessage(tg_user_id:int, message:str, keyboard_setting:dict
         "parse_mode": "HTML",
         "reply_markup": json.dumps(keyboard_setting)
     }
-    url = f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/sendMessage"
-    requests.post(url, data=params)
 
-def transaction_parser_llm(user_id: int, user_input: str):
+    return call_telegram_api(tg_user_id, "sendMessage", params)
+
+def EditMessageText(tg_user_id:int, message_id:int, message:str, keyboard_setting:dict = None):
     """
-    Sends user input to the LLM for transaction parsing.
+    Replaces the text (and inline keyboard) of a message sent by the bot.
 
     Args:
-        user_id (int): The ID of the user making the request.
-        user_input (str): The input text from the user to be parsed.
-    
-    Returns:
-        dict: The JSON response from the LLM API containing the parsed transaction data.
-    
+        tg_user_id (int): The Telegram user ID of the chat.
+        message_id (int): The ID of the message to edit.
+        message (str): The new message text.
+        keyboard_setting (dict, optional): The new inline keyboard. The keyboard is removed if None.
+    """
+    params = {
+        "chat_id": tg_user_id,
+        "message_id": message_id,
+        "text": message,
+        "parse_mode": "HTML"
+    }
+
+    if keyboard_setting is not None:
+        params["reply_markup"] = json.dumps(keyboard_setting)
+
+    return call_telegram_api(tg_user_id, "editMessageText", params)
+
+def EditMessageReplyMarkup(tg_user_id:int, message_id:int, keyboard_setting:dict = None):
+    """
+    Replaces the inline keyboard of a message sent by the bot.
+
+    Args:
+        tg_user_id (int): The Telegram user ID of the chat.
+        message_id (int): The ID of the message to edit.
+        keyboard_setting (dict, optional): The new inline keyboard. The keyboard is removed if None.
+    """
+    params = {
+        "chat_id": tg_user_id,
+        "message_id": message_id,
+        "reply_markup": json.dumps(keyboard_setting or {"inline_keyboard": []})
+    }
+
+    return call_telegram_api(tg_user_id, "editMessageReplyMarkup", params)
+
+def on_message_sent(sent_message, callback) -> None:
+    """
+    Calls callback(message_id) once a message sent with SendMessage / SendInlineKeyboardMessage
+    is sent, without waiting for it (message_id is None if the message was not sent).
+
+    In async send mode the callback runs on the sender thread when the queued message
+    is sent, so it must not block (queueing more Bot API calls is fine).
+
     Example:
-        >>> transaction_parser_llm(4, "Sample transaction text")
-        >>> {'status': 'success',
-            'message': 'Transaction processed successfully',
-            'data': {
-                'transaction': {
-                    'user_id': 1,
-                    'date': '2025-07-01',
-                    'category_id': 16,
-                    'description': "M記 (McDonald's)",
-                    'currency': 'HKD',
-                    'amount': 50.0
-                },
-                'llm_response': {
-                    'is_transaction': True,
-                    'date': '2025-07-01',
-                    'category_type': 'Expense',
-                    'category_name': 'Food',
-                    'description': "M記 (McDonald's)",
-                    'currency': 'HKD',
-                    'price': 50.0
-                }
-            },
-            'error': None}
-    """
-
-    response = requests.post(
-        url="http://127.0.0.1:5000/api/transaction_parser_llm",
-        json={
-            "user_id": user_id,
-            "user_input": user_input
-        }
-    )
+        >>> on_message_sent(SendMessage(user_id, "Loading..."), lambda message_id: EditMessageText(user_id, message_id, "Done"))
+    """
+    if not hasattr(sent_message, "add_done_callback"):
+        callback(_message_id(sent_message))
+        return
+
+    def done(future) -> None:
+        try:
+            message_id = _message_id(future.result())
+        except Exception:
+            message_id = None
+
+        try:
+            callback(message_id)
+        except Exception:
+            logger.exception("on_message_sent callback failed")
+
+    sent_message.add_done_callback(done)
+
+def _message_id(response_json: dict | None) -> int | None:
+    if not response_json or not response_json.get("ok"):
+        return None
 
-    return response.json()
\ No newline at end of file
+    return response_json["result"]["message_id"]
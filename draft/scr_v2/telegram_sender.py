@@ -0,0 +1,176 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class TokenBucket:
+    """A token bucket rate limiter (`rate` tokens per second, up to `capacity` tokens)."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_take(self) -> float:
+        """Takes a token if there is one. Returns 0, otherwise the seconds until the next token."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self) -> None:
+        """Waits until a token is taken."""
+        while True:
+            wait = self.try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class OutboundSender:
+    """
+    Sends Bot API calls from an asyncio event loop running in a background thread.
+
+    Handlers only queue the call and get a Future back. Calls are sent in order per chat,
+    limited by a global token bucket (Telegram allows ~30 messages per second per bot) and
+    a token bucket per chat (~1 message per second per chat). A call rejected with 429
+    is retried after the `retry_after` seconds returned by Telegram.
+    """
+
+    def __init__(
+        self,
+        client,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        max_retries: int = 3,
+        max_connections: int = 10
+    ):
+        """
+        Args:
+            client (TelegramClient): The client that sends the Bot API calls.
+            global_rate (float): Maximum calls per second over all chats.
+            chat_rate (float): Maximum calls per second to one chat.
+            chat_burst (float): Number of calls a chat can send at once before being limited by `chat_rate`.
+            max_retries (int): Number of retries of a call rejected with 429.
+            max_connections (int): Number of calls sent at the same time.
+        """
+        self.client = client
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._chat_buckets = {}
+        self._chat_queues = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="telegram-sender")
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the event loop thread (only once)."""
+        with self._lock:
+            if self._loop is not None:
+                return
+
+            self._loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self._loop.run_forever, name="telegram-sender-loop", daemon=True)
+            thread.start()
+
+    def enqueue(self, chat_id: int, method: str, params: dict) -> Future:
+        """
+        Queues a Bot API call without waiting for the network.
+
+        Args:
+            chat_id (int): The chat the call is sent to.
+            method (str): The Bot API method (e.g., sendMessage).
+            params (dict): The parameters of the method.
+
+        Returns:
+            Future: Resolved with the Bot API response json once the call is sent.
+        """
+        self.start()
+
+        future = Future()
+        self._loop.call_soon_threadsafe(self._put, chat_id, method, params, future)
+        return future
+
+    def backlog(self) -> dict:
+        """
+        Returns the number of calls waiting to be sent for each chat.
+
+        Example:
+            >>> outbound_sender.backlog()
+            >>> {1174923863: 2}
+        """
+        with self._lock:
+            return {chat_id: len(chat_queue) for chat_id, chat_queue in self._chat_queues.items()}
+
+    def _put(self, chat_id: int, method: str, params: dict, future: Future) -> None:
+        # Runs in the event loop thread
+        with self._lock:
+            chat_queue = self._chat_queues.get(chat_id)
+            if chat_queue is None:
+                chat_queue = self._chat_queues[chat_id] = deque()
+                self._loop.create_task(self._chat_worker(chat_id, chat_queue))
+            chat_queue.append((method, params, future))
+
+    async def _chat_worker(self, chat_id: int, chat_queue: deque) -> None:
+        """Sends the calls of one chat in order, ends when the chat has no more calls."""
+        chat_bucket = self._chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self._chat_buckets[chat_id] = TokenBucket(rate=self.chat_rate, capacity=self.chat_burst)
+
+        while True:
+            with self._lock:
+                if not chat_queue:
+                    del self._chat_queues[chat_id]
+                    break
+                method, params, future = chat_queue.popleft()
+
+            try:
+                future.set_result(await self._send(chat_bucket, method, params))
+            except Exception as e:
+                logger.exception(f"Telegram API {method} failed for chat {chat_id}")
+                future.set_exception(e)
+
+        self._prune_chat_buckets()
+
+    async def _send(self, chat_bucket: TokenBucket, method: str, params: dict) -> dict | None:
+        for attempt in range(self.max_retries + 1):
+            await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+
+            response_json = await self._loop.run_in_executor(self._executor, self.client.call, method, params)
+
+            if response_json is None or response_json.get("error_code") != 429:
+                return response_json
+
+            retry_after = response_json.get("parameters", {}).get("retry_after", 1)
+            logger.warning(f"Telegram API {method} rate limited, retry after {retry_after}s (attempt {attempt + 1})")
+            await asyncio.sleep(retry_after)
+
+        return response_json
+
+    def _prune_chat_buckets(self) -> None:
+        # A full bucket of an idle chat holds no state worth keeping
+        if len(self._chat_buckets) < 1024:
+            return
+
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items() if bucket.is_full()]:
+            if chat_id not in self._chat_queues:
+                del self._chat_buckets[chat_id]
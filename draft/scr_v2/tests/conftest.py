@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The bot modules are flat files in scr_v2 and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
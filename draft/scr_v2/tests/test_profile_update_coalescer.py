@@ -0,0 +1,83 @@
+import json
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from write_behind import ProfileUpdateCoalescer
+
+class PostgRESTStandIn(BaseHTTPRequestHandler):
+    """Answers PATCH /rest/v1/users?user_id=eq.<id> like PostgREST and records each request."""
+
+    requests = []
+
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, body))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def postgrest():
+    PostgRESTStandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PostgRESTStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+def make_coalescer(server, window):
+    def update_fields(user_id, fields):
+        # Same request as supabase.table("users").update(fields).eq("user_id", user_id)
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_port}/rest/v1/users?user_id=eq.{user_id}",
+            data=json.dumps(fields).encode(),
+            headers={"Content-Type": "application/json"},
+            method="PATCH"
+        )
+        urllib.request.urlopen(request).close()
+
+    return ProfileUpdateCoalescer(update_fields=update_fields, window=window)
+
+def test_rapid_edits_are_written_with_one_patch(postgrest):
+    coalescer = make_coalescer(postgrest, window=0.3)
+    current = {"username": "john", "default_currency": "USD"}
+
+    for i in range(10):
+        coalescer.submit(1, {"username": f"john_{i}"}, current)
+        coalescer.submit(1, {"default_currency": ("HKD", "JPY")[i % 2]}, current)
+
+    assert PostgRESTStandIn.requests == []
+    threading.Event().wait(0.6)
+
+    assert PostgRESTStandIn.requests == [
+        ("/rest/v1/users?user_id=eq.1", {"username": "john_9", "default_currency": "JPY"})
+    ]
+    assert coalescer.stats() == {"pending_users": 0, "writes": 1, "coalesced": 19, "skipped": 0}
+
+def test_edits_set_back_to_the_stored_values_are_not_written(postgrest):
+    coalescer = make_coalescer(postgrest, window=0.2)
+    current = {"username": "john", "default_currency": "USD"}
+
+    coalescer.submit(1, {"default_currency": "HKD"}, current)
+    coalescer.submit(1, {"default_currency": "USD"}, current)
+    coalescer.submit(2, {"username": "john"}, current)
+    threading.Event().wait(0.4)
+
+    assert PostgRESTStandIn.requests == []
+    assert coalescer.stats()["skipped"] == 2
+
+def test_flush_all_writes_the_pending_edits_at_once(postgrest):
+    coalescer = make_coalescer(postgrest, window=60)
+
+    coalescer.submit(1, {"username": "amy"}, {"username": "john"})
+    coalescer.submit(2, {"default_currency": "HKD"}, {"default_currency": "USD"})
+    coalescer.flush_all()
+
+    assert sorted(PostgRESTStandIn.requests) == [
+        ("/rest/v1/users?user_id=eq.1", {"username": "amy"}),
+        ("/rest/v1/users?user_id=eq.2", {"default_currency": "HKD"})
+    ]
@@ -0,0 +1,194 @@
+import time
+import threading
+import socketserver
+
+import pytest
+
+from session_backends import SQLiteSessionBackend, RedisSessionBackend
+from session_models import UserSession, SessionOption, PendingTransaction
+from session_store import SessionStore
+from update_queue import SharedUpdateDeduplicator
+
+class RedisStandIn(socketserver.StreamRequestHandler):
+    """Answers GET / SET [NX] [EX] / DEL / AUTH / SELECT like Redis and records each command."""
+
+    data = {}
+    commands = []
+    # Commands applied but answered by closing the connection (a reply lost in transit)
+    drop_reply = set()
+    lock = threading.Lock()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode("utf-8"))
+
+            reply = self.execute(args)
+            if args[0] in self.drop_reply:
+                self.drop_reply.discard(args[0])
+                return
+            self.wfile.write(reply)
+
+    def execute(self, args):
+        name, key = args[0], args[1] if len(args) > 1 else None
+        with self.lock:
+            self.commands.append(args)
+
+            entry = self.data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self.data[key]
+
+            if name in ("AUTH", "SELECT"):
+                return b"+OK\r\n"
+            if name == "GET":
+                if key not in self.data:
+                    return b"$-1\r\n"
+                value = self.data[key][0].encode("utf-8")
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == "SET":
+                options = args[3:]
+                if "NX" in options and key in self.data:
+                    return b"$-1\r\n"
+                expires_at = time.time() + int(options[options.index("EX") + 1]) if "EX" in options else None
+                self.data[key] = (args[2], expires_at)
+                return b"+OK\r\n"
+            if name == "DEL":
+                return b":%d\r\n" % (self.data.pop(key, None) is not None)
+
+            return b"-ERR unknown command\r\n"
+
+@pytest.fixture
+def redis_server():
+    RedisStandIn.data = {}
+    RedisStandIn.commands = []
+    RedisStandIn.drop_reply = set()
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), RedisStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=["sqlite", "redis"])
+def make_backend(request, tmp_path):
+    """Returns a function creating a new connection (as another worker process would) to the same storage."""
+    if request.param == "sqlite":
+        return lambda ttl=60: SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3"), ttl=ttl)
+
+    server = request.getfixturevalue("redis_server")
+    return lambda ttl=60: RedisSessionBackend(host="127.0.0.1", port=server.server_address[1], ttl=ttl)
+
+def test_sessions_are_saved_loaded_and_deleted(make_backend):
+    writer, reader = make_backend(), make_backend()
+    assert reader.load(1) is None
+
+    writer.save(1, {"username": "陳大文", "option": None})
+    assert reader.load(1) == {"username": "陳大文", "option": None}
+
+    writer.save(1, {"username": "john"})
+    assert reader.load(1) == {"username": "john"}
+
+    reader.delete(1)
+    assert writer.load(1) is None
+
+def test_sessions_and_markers_expire(make_backend):
+    backend = make_backend(ttl=1)
+    backend.save(1, {"username": "john"})
+    assert backend.add_marker("update:1", ttl=1) is True
+
+    time.sleep(1.1)
+    assert backend.load(1) is None
+    assert backend.add_marker("update:1", ttl=1) is True
+
+def test_a_marker_is_set_by_one_worker_only(make_backend):
+    first, second = make_backend(), make_backend()
+
+    assert first.add_marker("update:1", ttl=60) is True
+    assert second.add_marker("update:1", ttl=60) is False
+    assert first.add_marker("update:2", ttl=60) is True
+
+    second.remove_marker("update:1")
+    assert second.add_marker("update:1", ttl=60) is True
+
+def test_a_session_committed_by_one_store_is_begun_by_another(make_backend):
+    loads = []
+    def loader(user_id):
+        loads.append(user_id)
+        return UserSession(username="john", default_currency="HKD")
+
+    first = SessionStore(loader=loader, backend=make_backend())
+    second = SessionStore(loader=loader, backend=make_backend())
+
+    session = first.begin(1)
+    session.option = SessionOption.TRANSACTION_AMOUNT
+    session.temp_transaction = PendingTransaction(1, "2025-07-01", 16, "Expense", "Food", "KFC", "HKD", 50.0)
+    session.message_id = 42
+    first.commit(1)
+
+    assert second.begin(1).to_dict() == session.to_dict()
+    assert loads == [1]
+
+    # The local copy of the first store is replaced by the stored session
+    second[1].username = "amy"
+    second.commit(1)
+    assert first.begin(1).username == "amy"
+
+def test_shared_deduplicator_on_each_backend(make_backend):
+    first = SharedUpdateDeduplicator(make_backend(), ttl=60)
+    second = SharedUpdateDeduplicator(make_backend(), ttl=60)
+
+    assert first.is_duplicate(1) is False
+    assert second.is_duplicate(1) is True
+    assert first.is_duplicate(1) is True
+    assert first.duplicates + second.duplicates == 2
+
+    second.forget(1)
+    assert first.is_duplicate(1) is False
+
+def test_redis_commands_and_url(redis_server):
+    backend = RedisSessionBackend.from_url(f"redis://:secret@127.0.0.1:{redis_server.server_address[1]}/2", ttl=60)
+
+    backend.save(1, {"username": "john"})
+    backend.add_marker("update:1", ttl=30)
+    backend.remove_marker("update:1")
+
+    assert RedisStandIn.commands == [
+        ["AUTH", "secret"],
+        ["SELECT", "2"],
+        ["SET", "bookkeeping:session:1", '{"username": "john"}', "EX", "60"],
+        ["SET", "bookkeeping:marker:update:1", "1", "NX", "EX", "30"],
+        ["DEL", "bookkeeping:marker:update:1"]
+    ]
+
+def test_redis_resends_only_idempotent_commands(redis_server):
+    backend = RedisSessionBackend(host="127.0.0.1", port=redis_server.server_address[1])
+    backend.save(1, {"username": "john"})
+
+    # The reply of GET is lost: sent again on a new connection
+    RedisStandIn.drop_reply.add("GET")
+    assert backend.load(1) == {"username": "john"}
+
+    # The reply of SET NX is lost after the marker was set: not sent again
+    RedisStandIn.drop_reply.add("SET")
+    with pytest.raises(ConnectionError):
+        backend.add_marker("update:1", ttl=60)
+    assert [command[0] for command in RedisStandIn.commands] == ["SET", "GET", "GET", "SET"]
+
+def test_shared_deduplicator_falls_back_to_its_window_when_redis_fails(redis_server):
+    deduplicator = SharedUpdateDeduplicator(RedisSessionBackend(host="127.0.0.1", port=redis_server.server_address[1]), ttl=60)
+
+    # A new update whose SET NX reply was lost is not dropped as a duplicate
+    RedisStandIn.drop_reply.add("SET")
+    assert deduplicator.is_duplicate(1) is False
+
+    redis_server.shutdown()
+    redis_server.server_close()
+    down = SharedUpdateDeduplicator(RedisSessionBackend(host="127.0.0.1", port=redis_server.server_address[1], timeout=1), ttl=60)
+    assert down.is_duplicate(2) is False
+    assert down.is_duplicate(2) is True
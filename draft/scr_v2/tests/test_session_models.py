@@ -0,0 +1,35 @@
+from session_models import PendingTransaction, UserSession, SessionOption
+
+def make_transaction(**fields):
+    transaction = {
+        "user_id": 1, "date": "2025-07-01", "category_id": 16, "category_type": "Expense",
+        "category_name": "Food", "description": "KFC", "currency": "HKD", "amount": 50.0
+    }
+    transaction.update(fields)
+    return PendingTransaction.from_dict(transaction)
+
+def test_a_valid_transaction_has_no_errors():
+    assert make_transaction().validation_errors() == []
+    assert make_transaction(amount="12.5").validation_errors() == []
+
+def test_rows_the_transactions_table_rejects_are_reported():
+    assert make_transaction(category_id=None).validation_errors() == ["The category Expense / Food does not exist"]
+    assert make_transaction(amount="fifty").validation_errors() == ["The amount fifty is not a number"]
+    assert make_transaction(amount="nan").validation_errors() == ["The amount nan is not a number"]
+    assert make_transaction(amount=0).validation_errors() == ["The amount 0 must be greater than 0"]
+    assert make_transaction(amount=-5).validation_errors() == ["The amount -5 must be greater than 0"]
+    assert make_transaction(amount=0.004).validation_errors() == ["The amount 0.004 must be greater than 0"]
+    assert make_transaction(amount=1e10).validation_errors() == ["The amount 10000000000.0 is too large"]
+    assert make_transaction(currency="HKDD").validation_errors() == ["The currency HKDD must be a 3-letter code (e.g., HKD)"]
+    assert make_transaction(currency=None).validation_errors() == ["The currency None must be a 3-letter code (e.g., HKD)"]
+    assert make_transaction(date="2025-02-30").validation_errors() == ["The date 2025-02-30 is not a valid date (YYYY-MM-DD)"]
+
+def test_session_round_trips_through_a_dict():
+    session = UserSession(
+        username="john", default_currency="HKD", option=SessionOption.TRANSACTION_AMOUNT,
+        temp_transaction=make_transaction(), message_id=42
+    )
+    restored = UserSession.from_dict(session.to_dict())
+
+    assert restored.to_dict() == session.to_dict()
+    assert restored.option is SessionOption.TRANSACTION_AMOUNT
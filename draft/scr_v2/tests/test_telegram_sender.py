@@ -0,0 +1,53 @@
+import time
+import threading
+
+from telegram_sender import OutboundSender
+
+class FakeClient:
+    """Records the Bot API calls; answers the first call of `rate_limited` chats with a 429."""
+
+    def __init__(self, rate_limited=(), retry_after=0.2):
+        self.calls = []
+        self.rate_limited = set(rate_limited)
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+
+    def call(self, method, params):
+        with self._lock:
+            chat_id = params["chat_id"]
+            if chat_id in self.rate_limited:
+                self.rate_limited.discard(chat_id)
+                return {"ok": False, "error_code": 429, "parameters": {"retry_after": self.retry_after}}
+            self.calls.append((chat_id, params["text"], time.monotonic()))
+            return {"ok": True}
+
+def test_messages_of_a_chat_are_sent_in_order():
+    client = FakeClient()
+    sender = OutboundSender(client, global_rate=1000, chat_rate=1000, chat_burst=1000)
+
+    futures = [
+        sender.enqueue(chat_id, "sendMessage", {"chat_id": chat_id, "text": seq})
+        for seq in range(50)
+        for chat_id in (1, 2, 3)
+    ]
+    for future in futures:
+        assert future.result(timeout=5) == {"ok": True}
+
+    for chat_id in (1, 2, 3):
+        assert [text for chat, text, _ in client.calls if chat == chat_id] == list(range(50))
+
+def test_chat_rate_limit_and_429_keep_the_order():
+    client = FakeClient(rate_limited={1}, retry_after=0.2)
+    sender = OutboundSender(client, global_rate=1000, chat_rate=10, chat_burst=2)
+
+    start = time.monotonic()
+    futures = [sender.enqueue(1, "sendMessage", {"chat_id": 1, "text": seq}) for seq in range(6)]
+    for future in futures:
+        assert future.result(timeout=5) == {"ok": True}
+
+    sent = [(text, sent_at - start) for _, text, sent_at in client.calls]
+    assert [text for text, _ in sent] == list(range(6))
+
+    # The first call waited for retry_after, then the chat bucket (burst 2, 10/s) spaced the rest
+    assert sent[0][1] >= 0.2
+    assert sent[-1][1] >= 0.2 + 0.3
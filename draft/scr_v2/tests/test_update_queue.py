@@ -0,0 +1,89 @@
+import threading
+
+from update_queue import ShardedUpdateDispatcher, UpdateDeduplicator, SharedUpdateDeduplicator
+from session_backends import SQLiteSessionBackend
+
+def test_updates_of_a_user_are_processed_in_order():
+    processed = {}
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def handler(update):
+        with lock:
+            processed.setdefault(update["user_id"], []).append(update["seq"])
+            if sum(len(seqs) for seqs in processed.values()) == 400:
+                done.set()
+
+    dispatcher = ShardedUpdateDispatcher(handler=handler, num_workers=4, max_queue_size=1000)
+    for seq in range(100):
+        for user_id in (1, 2, 3, 4):
+            assert dispatcher.submit({"user_id": user_id, "seq": seq}, key=user_id)
+
+    assert done.wait(timeout=5)
+    assert processed == {user_id: list(range(100)) for user_id in (1, 2, 3, 4)}
+
+def test_submit_returns_false_when_the_shard_is_full():
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(update):
+        started.set()
+        release.wait(timeout=5)
+
+    # 2 shards of 2 slots each
+    dispatcher = ShardedUpdateDispatcher(handler=handler, num_workers=2, max_queue_size=4)
+    user_id = 10
+    shard = dispatcher.shard_of(user_id)
+
+    # The worker takes the first update and blocks, the next two fill the queue
+    assert dispatcher.submit({"seq": 0}, key=user_id)
+    assert started.wait(timeout=5)
+    assert dispatcher.submit({"seq": 1}, key=user_id)
+    assert dispatcher.submit({"seq": 2}, key=user_id)
+
+    assert dispatcher.submit({"seq": 3}, key=user_id) is False
+    assert dispatcher.stats()[shard]["dropped"] == 1
+
+    # A user on the other shard is not blocked by the full one
+    other_user_id = next(key for key in range(100) if dispatcher.shard_of(key) != shard)
+    assert dispatcher.submit({"seq": 0}, key=other_user_id)
+
+    release.set()
+
+def test_deduplicator_rejects_ids_in_the_window():
+    deduplicator = UpdateDeduplicator(window_size=3)
+
+    assert deduplicator.is_duplicate(1) is False
+    assert deduplicator.is_duplicate(1) is True
+    for update_id in (2, 3, 4):
+        assert deduplicator.is_duplicate(update_id) is False
+
+    # 1 left the window
+    assert deduplicator.is_duplicate(1) is False
+    assert deduplicator.duplicates == 1
+
+def test_forgotten_id_is_rejected_again_once_seen_again():
+    deduplicator = UpdateDeduplicator(window_size=3)
+
+    assert deduplicator.is_duplicate(1) is False
+    deduplicator.forget(1)
+    assert deduplicator.is_duplicate(1) is False
+    assert deduplicator.is_duplicate(2) is False
+    assert deduplicator.is_duplicate(3) is False
+
+    # The slot of the forgotten copy was reused, the newer copy is still in the window
+    assert deduplicator.is_duplicate(1) is True
+
+def test_shared_deduplicator_rejects_updates_received_by_another_worker(tmp_path):
+    # Two workers, each with its own backend connection to the same file
+    first = SharedUpdateDeduplicator(SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3")), ttl=60)
+    second = SharedUpdateDeduplicator(SQLiteSessionBackend(str(tmp_path / "sessions.sqlite3")), ttl=60)
+
+    assert first.is_duplicate(1) is False
+    assert second.is_duplicate(1) is True
+    assert second.duplicates == 1
+
+    # A failed update is accepted again by any worker
+    first.forget(1)
+    assert second.is_duplicate(1) is False
+    assert first.is_duplicate(1) is True
@@ -0,0 +1,213 @@
+import os
+import json
+import signal
+import multiprocessing
+
+from write_behind import TransactionWriteBuffer
+
+class InsertError(Exception):
+    def __init__(self, code=None):
+        super().__init__(code)
+        self.code = code
+
+class FakeDatabase:
+    """Stand-in of transactions_bulk_insert: can be down, rejects rows with a negative amount, skips stored pending_ids."""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def insert_rows(self, rows):
+        if self.down:
+            raise InsertError()
+        if any(row["amount"] < 0 for row in rows):
+            raise InsertError("23514")
+        # ON CONFLICT (pending_id) DO NOTHING
+        stored = {row["pending_id"] for row in self.rows}
+        self.rows.extend(row for row in rows if row["pending_id"] not in stored)
+
+def is_rejected(error):
+    return error.code is not None
+
+def make_buffer(database, tmp_path):
+    return TransactionWriteBuffer(
+        insert_rows=database.insert_rows,
+        spool_path=str(tmp_path / "spool.jsonl"),
+        flush_interval=60,
+        is_rejected=is_rejected
+    )
+
+def read_lines(path):
+    return [json.loads(line) for line in open(path, encoding="utf-8")] if path.exists() else []
+
+def test_outage_keeps_the_rows_in_the_spool(tmp_path):
+    database = FakeDatabase()
+    buffer = make_buffer(database, tmp_path)
+    for amount in (1, 2, 3):
+        buffer.add({"amount": amount})
+
+    database.down = True
+    for _ in range(10):
+        assert buffer.flush() == 0
+
+    assert len(read_lines(tmp_path / f"spool.jsonl.{os.getpid()}")) == 3
+    assert not (tmp_path / "spool.jsonl.failed").exists()
+    stats = buffer.stats()
+    assert stats["pending"] == 3 and stats["flush_count"] == 0 and stats["failed_flushes"] == 10
+    assert stats["retry_in_s"] > 0
+
+    database.down = False
+    assert buffer.flush() == 3
+    assert [row["amount"] for row in database.rows] == [1, 2, 3]
+    assert read_lines(tmp_path / f"spool.jsonl.{os.getpid()}") == []
+
+def test_only_rejected_rows_are_dead_lettered_and_can_be_replayed(tmp_path):
+    database = FakeDatabase()
+    buffer = make_buffer(database, tmp_path)
+    for amount in (1, -2, 3):
+        buffer.add({"amount": amount})
+
+    assert buffer.flush() == 2
+    assert [row["amount"] for row in database.rows] == [1, 3]
+    assert [entry["row"]["amount"] for entry in read_lines(tmp_path / "spool.jsonl.failed")] == [-2]
+    assert buffer.stats()["dead_lettered_rows"] == 1
+
+    # Still invalid: back to the dead-letter file
+    assert buffer.replay_failed() == {"replayed": 1, "inserted": 0}
+    assert len(read_lines(tmp_path / "spool.jsonl.failed")) == 1
+
+    # Fixed: inserted
+    entry = read_lines(tmp_path / "spool.jsonl.failed")[0]
+    entry["row"]["amount"] = 2
+    (tmp_path / "spool.jsonl.failed").write_text(json.dumps(entry) + "\n", encoding="utf-8")
+    assert buffer.replay_failed() == {"replayed": 1, "inserted": 1}
+    assert sorted(row["amount"] for row in database.rows) == [1, 2, 3]
+    assert not (tmp_path / "spool.jsonl.failed").exists()
+
+def test_replay_counts_only_the_replayed_rows(tmp_path):
+    database = FakeDatabase()
+    buffer = make_buffer(database, tmp_path)
+    buffer.add({"amount": -1})
+    assert buffer.flush() == 0
+
+    # Rows buffered meanwhile are not counted as replayed
+    entry = read_lines(tmp_path / "spool.jsonl.failed")[0]
+    entry["row"]["amount"] = 1
+    (tmp_path / "spool.jsonl.failed").write_text(json.dumps(entry) + "\n", encoding="utf-8")
+    buffer.add({"amount": 2})
+    buffer.add({"amount": -3})
+
+    assert buffer.replay_failed() == {"replayed": 1, "inserted": 1}
+    assert buffer.stats()["pending"] == 2
+    assert buffer.flush() == 1
+    assert sorted(row["amount"] for row in database.rows) == [1, 2]
+
+def add_rows_and_wait(spool_path, amounts, ready):
+    # A worker process whose flushes never run
+    buffer = TransactionWriteBuffer(insert_rows=None, spool_path=spool_path, flush_interval=3600)
+    for amount in amounts:
+        buffer.add({"amount": amount})
+    ready.set()
+    signal.pause()
+
+def start_worker(tmp_path, amounts):
+    context = multiprocessing.get_context("fork")
+    ready = context.Event()
+    worker = context.Process(target=add_rows_and_wait, args=(str(tmp_path / "spool.jsonl"), amounts, ready), daemon=True)
+    worker.start()
+    assert ready.wait(timeout=10)
+    return worker
+
+def test_workers_do_not_overwrite_each_other_spool(tmp_path):
+    worker = start_worker(tmp_path, [10, 20])
+
+    database = FakeDatabase()
+    buffer = make_buffer(database, tmp_path)
+    buffer.add({"amount": 1})
+    assert buffer.flush() == 1
+
+    # The live worker's rows are neither erased nor taken over
+    assert buffer.recover() == 0
+    assert [entry["row"]["amount"] for entry in read_lines(tmp_path / f"spool.jsonl.{worker.pid}")] == [10, 20]
+
+    worker.kill()
+    worker.join()
+
+    # Once the worker is gone its rows are claimed and flushed by this process
+    assert buffer.recover() == 2
+    assert not (tmp_path / f"spool.jsonl.{worker.pid}").exists()
+    buffer.flush()
+    assert sorted(row["amount"] for row in database.rows) == [1, 10, 20]
+
+def recover_and_flush(spool_path, inserted_path, barrier):
+    def insert_rows(rows):
+        with open(inserted_path, "a", encoding="utf-8") as inserted:
+            inserted.write("".join(json.dumps(row) + "\n" for row in rows))
+
+    buffer = TransactionWriteBuffer(insert_rows=insert_rows, spool_path=spool_path, flush_interval=3600)
+    barrier.wait()
+    buffer.start()
+    buffer.flush()
+
+def test_a_dead_worker_spool_is_recovered_once(tmp_path):
+    worker = start_worker(tmp_path, [10, 20, 30])
+    worker.kill()
+    worker.join()
+
+    # Processes starting at the same time race for the file, the rename lets only one of them claim it
+    context = multiprocessing.get_context("fork")
+    barrier = context.Barrier(4)
+    processes = [
+        context.Process(target=recover_and_flush, args=(str(tmp_path / "spool.jsonl"), str(tmp_path / "inserted.jsonl"), barrier))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=10)
+
+    assert sorted(row["amount"] for row in read_lines(tmp_path / "inserted.jsonl")) == [10, 20, 30]
+
+def test_a_flush_repeated_after_a_lost_response_inserts_once(tmp_path):
+    database = FakeDatabase()
+    buffer = make_buffer(database, tmp_path)
+    for amount in (1, 2):
+        buffer.add({"amount": amount})
+
+    def insert_then_lose_response(rows):
+        database.insert_rows(rows)
+        raise InsertError()
+
+    buffer.insert_rows = insert_then_lose_response
+    assert buffer.flush() == 0
+
+    buffer.insert_rows = database.insert_rows
+    assert buffer.flush() == 2
+    assert [row["amount"] for row in database.rows] == [1, 2]
+
+def insert_and_crash(spool_path, inserted_path):
+    def insert_rows(rows):
+        with open(inserted_path, "a", encoding="utf-8") as inserted:
+            inserted.write("".join(json.dumps(row) + "\n" for row in rows))
+        # Crash after the insert, before the spool file is rewritten
+        os._exit(1)
+
+    buffer = TransactionWriteBuffer(insert_rows=insert_rows, spool_path=spool_path, flush_interval=3600)
+    for amount in (10, 20):
+        buffer.add({"amount": amount})
+    buffer.flush()
+
+def test_recovery_after_a_crash_during_a_flush_inserts_once(tmp_path):
+    process = multiprocessing.get_context("fork").Process(
+        target=insert_and_crash, args=(str(tmp_path / "spool.jsonl"), str(tmp_path / "inserted.jsonl"))
+    )
+    process.start()
+    process.join(timeout=10)
+
+    database = FakeDatabase()
+    database.rows = read_lines(tmp_path / "inserted.jsonl")
+    buffer = make_buffer(database, tmp_path)
+
+    assert buffer.recover() == 2
+    buffer.flush()
+    assert sorted(row["amount"] for row in database.rows) == [10, 20]
@@ -0,0 +1,114 @@
+import numpy as np
+
+class TransactionFrame:
+    """
+    Compact columnar copy of a user's transactions for date range queries.
+
+    Dates are a sorted datetime64[D] array, so a date range is found with two binary
+    searches (`searchsorted`) instead of a mask over every row. Amounts are float64 and
+    categories are int32 codes into `categories`, so totals of a range are `bincount`
+    reductions over array slices, without grouping Python objects.
+    """
+
+    def __init__(self, dates, amounts, category_codes, categories: list[tuple[str, str]]):
+        """
+        Args:
+            dates (array-like): Transaction dates (anything convertible to datetime64[D]).
+            amounts (array-like): Transaction amounts.
+            category_codes (array-like): Index of each transaction's category in `categories`.
+            categories (list[tuple[str, str]]): The (category_type, category_name) of each code.
+        """
+        dates = np.asarray(dates, dtype="datetime64[D]")
+
+        # Positions of the rows in the input, in date order (used to slice the input frame)
+        self.rows = np.argsort(dates, kind="stable")
+        self.dates = dates[self.rows]
+        self.amounts = np.asarray(amounts, dtype=np.float64)[self.rows]
+        self.category_codes = np.asarray(category_codes, dtype=np.int32)[self.rows]
+
+        self.categories = list(categories)
+        self.category_types = sorted({category_type for category_type, _ in self.categories})
+        category_type_codes = np.array(
+            [self.category_types.index(category_type) for category_type, _ in self.categories],
+            dtype=np.int32
+        )
+        self.type_codes = category_type_codes[self.category_codes] if len(self.categories) else self.category_codes.copy()
+
+    @classmethod
+    def from_frame(cls, frame) -> "TransactionFrame":
+        """
+        Builds the columnar frame of a DataFrame with `date`, `amount`, `category_type` and `category_name` columns.
+
+        Example:
+            >>> TransactionFrame.from_frame(dashboard_data.get_frame(123456789))
+        """
+        categories = {}
+        category_codes = np.fromiter(
+            (categories.setdefault(key, len(categories)) for key in zip(frame["category_type"], frame["category_name"])),
+            dtype=np.int32,
+            count=len(frame)
+        )
+
+        return cls(
+            dates=frame["date"].to_numpy(dtype="datetime64[D]"),
+            amounts=frame["amount"].to_numpy(dtype=np.float64),
+            category_codes=category_codes,
+            categories=list(categories)
+        )
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def select(self, start_date, end_date) -> slice:
+        """
+        Returns the slice of the rows from `start_date` to `end_date` (inclusive) in the sorted arrays.
+
+        Example:
+            >>> frame.select("2025-07-01", "2025-07-31")
+            >>> slice(1520, 1583)
+        """
+        lo = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end_date, "D"), side="right")
+        return slice(int(lo), int(max(lo, hi)))
+
+    def row_positions(self, start_date, end_date) -> np.ndarray:
+        """Returns the positions in the input frame of the rows from `start_date` to `end_date`, in date order."""
+        return self.rows[self.select(start_date, end_date)]
+
+    def daily_totals(self, start_date, end_date) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the days with transactions in the range, with their total amount and number of transactions.
+
+        Example:
+            >>> frame.daily_totals("2025-07-01", "2025-07-31")
+            >>> (array(['2025-07-01', '2025-07-03'], dtype='datetime64[D]'), array([96., 12.]), array([2, 1]))
+        """
+        selected = self.select(start_date, end_date)
+        dates = self.dates[selected]
+        if len(dates) == 0:
+            return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64), np.array([], dtype=np.int64)
+
+        day_offsets = (dates - dates[0]).astype(np.int64)
+        totals = np.bincount(day_offsets, weights=self.amounts[selected])
+        counts = np.bincount(day_offsets)
+
+        days = np.flatnonzero(counts)
+        return dates[0] + days, totals[days], counts[days]
+
+    def category_totals(self, start_date, end_date) -> tuple[list[tuple[str, str]], np.ndarray, np.ndarray]:
+        """Returns the categories with transactions in the range, with their total amount and number of transactions."""
+        selected = self.select(start_date, end_date)
+        return self._totals_by_code(self.category_codes[selected], self.amounts[selected], self.categories)
+
+    def type_totals(self, start_date, end_date) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """Returns the category types (Income / Expense) in the range, with their total amount and number of transactions."""
+        selected = self.select(start_date, end_date)
+        return self._totals_by_code(self.type_codes[selected], self.amounts[selected], self.category_types)
+
+    @staticmethod
+    def _totals_by_code(codes: np.ndarray, amounts: np.ndarray, labels: list) -> tuple[list, np.ndarray, np.ndarray]:
+        totals = np.bincount(codes, weights=amounts, minlength=len(labels))
+        counts = np.bincount(codes, minlength=len(labels))
+
+        used = np.flatnonzero(counts)
+        return [labels[code] for code in used], totals[used], counts[used]
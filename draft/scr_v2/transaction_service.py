@@ -0,0 +1,258 @@
+import time
+import config
+import logging
+
+from llm_cache import ExtractionCache
+from fast_path_parser import FastPathExtractor
+from write_behind import TransactionWriteBuffer
+from llm_tools import TransactionExtractorLLM
+from supabase_api import *
+from utils import *
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+# Shared by the webhook commands and the HTTP endpoints
+extraction_cache = ExtractionCache(
+    max_size=config.LLM_CACHE_SIZE,
+    ttl=config.LLM_CACHE_TTL,
+    db_path=config.LLM_CACHE_PATH
+)
+extractor_llm = TransactionExtractorLLM(model_name="deepseek-chat", temperature=0.0, cache=extraction_cache)
+fast_path_extractor = FastPathExtractor(
+    min_confidence=config.FAST_PATH_MIN_CONFIDENCE,
+    min_support=config.FAST_PATH_MIN_SUPPORT
+)
+
+def invalidate_saved_months(transactions: list[dict]) -> None:
+    """Drops the cached monthly summaries of the months of the inserted transactions."""
+    for user_id, month in {(row["user_id"], str(row["date"])[:7]) for row in transactions}:
+        invalidate_monthly_summary(user_id, month)
+
+# Saved transactions are inserted in batches by a background thread
+transaction_write_buffer = TransactionWriteBuffer(
+    insert_rows=transactions_bulk_insert,
+    spool_path=config.WRITE_BUFFER_SPOOL_PATH,
+    max_batch_size=config.WRITE_BUFFER_MAX_ROWS,
+    flush_interval=config.WRITE_BUFFER_FLUSH_INTERVAL,
+    max_backoff=config.WRITE_BUFFER_MAX_BACKOFF,
+    is_rejected=is_rejected_row_error,
+    on_flush=invalidate_saved_months
+)
+
+class TransactionParseError(Exception):
+    """Raised when a user input cannot be parsed into a transaction."""
+
+    def __init__(self, code: str, message: str, http_status: int):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.http_status = http_status
+
+@log_function(logger)
+def parse_transaction(user_id: int, user_input: str) -> dict:
+    """
+    Parses the transaction details of a user input with the LLM.
+
+    Args:
+        user_id (int): The ID of the user, must be registered in the database.
+        user_input (str): The input text from the user to be parsed.
+
+    Returns:
+        dict: The transaction ready to be saved and the raw LLM response.
+
+    Raises:
+        TransactionParseError: With code USER_NOT_FOUND, INVALID_TRANSACTION or CATEGORY_NOT_FOUND.
+
+    Example:
+        >>> parse_transaction(1, "KFC 50")
+        >>> {
+                'transaction': {
+                    'user_id': 1,
+                    'date': '2025-07-01',
+                    'category_id': 16,
+                    'description': 'KFC',
+                    'currency': 'HKD',
+                    'amount': 50.0
+                },
+                'llm_response': {
+                    'is_transaction': True,
+                    'date': '2025-07-01',
+                    'category_type': 'Expense',
+                    'category_name': 'Food',
+                    'description': 'KFC',
+                    'currency': 'HKD',
+                    'price': 50.0
+                }
+            }
+    """
+    # Check if the user ID is valid and registered in the database
+    user_info = get_user_info(user_id)
+    if user_info is None:
+        logger.error("USER_NOT_FOUND")
+        raise TransactionParseError(
+            code="USER_NOT_FOUND",
+            message="user_id not found in the database. Please register first",
+            http_status=404
+        )
+
+    # Simple inputs of known merchants (e.g., "KFC 50") are parsed without the LLM
+    fast_path_response = fast_path_extractor.extract(user_input, user_id, user_info.get("default_currency")) if config.FAST_PATH_ENABLED else None
+
+    if fast_path_response is not None:
+        llm_response = fast_path_response.model_dump()
+    else:
+        # Extracts bookkeeping features by LLM
+        start = time.perf_counter()
+        llm_response = extractor_llm.extract_bookkeeping_features(user_input=user_input, user_id=user_id)
+        fast_path_extractor.record_fallback_latency(time.perf_counter() - start)
+
+    transaction = build_transaction(user_id, llm_response)
+
+    return {
+        "transaction": transaction,
+        "llm_response": llm_response
+    }
+
+def build_transaction(user_id: int, llm_response: dict, category_map: dict = None) -> dict:
+    """
+    Validates an extracted transaction and resolves its category ID.
+
+    Args:
+        user_id (int): The ID of the user.
+        llm_response (dict): The extracted transaction data (TransactionData fields).
+        category_map (dict, optional): The user's {(type, name): category_id} map, fetched if None.
+
+    Returns:
+        dict: The transaction ready to be saved.
+
+    Raises:
+        TransactionParseError: With code INVALID_TRANSACTION or CATEGORY_NOT_FOUND.
+    """
+    # Check if the LLM response indicates a transaction
+    if llm_response["is_transaction"] is False:
+        logger.error("INVALID_TRANSACTION")
+        raise TransactionParseError(
+            code="INVALID_TRANSACTION",
+            message="The input does not contain a valid transaction",
+            http_status=400
+        )
+
+    # Retrieve the category ID from supabase database (cached per user)
+    if category_map is None:
+        category_map = get_user_category_map(user_id)
+    category_id = category_map.get((llm_response["category_type"], llm_response["category_name"]))
+    if category_id is None:
+        # Reloads the categories in case the category was added since they were cached
+        category_id = get_category_id(llm_response["category_type"], llm_response["category_name"], user_id)
+
+    # Check if the category ID is found
+    if category_id is None:
+        logger.error("CATEGORY_NOT_FOUND")
+        raise TransactionParseError(
+            code="CATEGORY_NOT_FOUND",
+            message="Category not found in the database",
+            http_status=404
+        )
+
+    # If the LLM response indicates a transaction, prepare the transaction data
+    return {
+        "user_id": user_id,
+        "date": llm_response["date"],
+        "category_id": category_id,
+        "description": llm_response["description"],
+        "currency": llm_response["currency"],
+        "amount": llm_response["price"]
+    }
+
+@log_function(logger)
+def parse_transactions_batch(user_id: int, user_inputs: list[str], batch_size: int = 50) -> list[dict]:
+    """
+    Parses many user inputs, packing the inputs that need the LLM into one call per `batch_size` inputs.
+
+    An input that cannot be parsed gets an error entry; it does not fail the other inputs.
+
+    Args:
+        user_id (int): The ID of the user, must be registered in the database.
+        user_inputs (list[str]): The input texts, one transaction each.
+        batch_size (int): Maximum number of inputs in one LLM call.
+
+    Returns:
+        list[dict]: One result for each input (same order).
+
+    Raises:
+        TransactionParseError: With code USER_NOT_FOUND (for the whole batch).
+
+    Example:
+        >>> parse_transactions_batch(1, ["早餐 30", "hello"])
+        >>> [
+                {'index': 0, 'status': 'success', 'data': {'transaction': {...}, 'llm_response': {...}}, 'error': None},
+                {'index': 1, 'status': 'error', 'data': None, 'error': {'code': 'INVALID_TRANSACTION', 'message': '...'}}
+            ]
+    """
+    # Check if the user ID is valid and registered in the database
+    user_info = get_user_info(user_id)
+    if user_info is None:
+        logger.error("USER_NOT_FOUND")
+        raise TransactionParseError(
+            code="USER_NOT_FOUND",
+            message="user_id not found in the database. Please register first",
+            http_status=404
+        )
+
+    # One category fetch for the whole batch
+    category_map = get_user_category_map(user_id)
+
+    llm_responses = [None] * len(user_inputs)
+
+    # Simple inputs of known merchants are parsed without the LLM
+    if config.FAST_PATH_ENABLED:
+        for i, user_input in enumerate(user_inputs):
+            fast_path_response = fast_path_extractor.extract(user_input, user_id, user_info.get("default_currency"))
+            if fast_path_response is not None:
+                llm_responses[i] = fast_path_response.model_dump()
+
+    # The other inputs are packed into as few LLM calls as possible
+    pending = [i for i, llm_response in enumerate(llm_responses) if llm_response is None]
+    for chunk_start in range(0, len(pending), batch_size):
+        chunk = pending[chunk_start:chunk_start + batch_size]
+        try:
+            chunk_responses = extractor_llm.extract_bookkeeping_features_batch([user_inputs[i] for i in chunk], user_id)
+        except Exception:
+            logger.exception("Batch extraction failed")
+            continue
+
+        for i, llm_response in zip(chunk, chunk_responses):
+            llm_responses[i] = llm_response
+
+    results = []
+    for i, llm_response in enumerate(llm_responses):
+        try:
+            if llm_response is None:
+                raise TransactionParseError(
+                    code="EXTRACTION_FAILED",
+                    message="The input could not be parsed",
+                    http_status=502
+                )
+
+            transaction = build_transaction(user_id, llm_response, category_map)
+            results.append({
+                "index": i,
+                "status": "success",
+                "data": {
+                    "transaction": transaction,
+                    "llm_response": llm_response
+                },
+                "error": None
+            })
+        except TransactionParseError as e:
+            results.append({
+                "index": i,
+                "status": "error",
+                "data": None,
+                "error": {
+                    "code": e.code,
+                    "message": e.message
+                }
+            })
+
+    return results
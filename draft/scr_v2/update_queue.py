@@ -0,0 +1,223 @@
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class ShardedUpdateDispatcher:
+    """
+    Processes Telegram updates in the background, keyed by user (chat ID).
+
+    Every shard has its own queue and a single worker thread. All updates of one
+    user go to the same shard, so they are processed strictly in order, while the
+    updates of different users are processed in parallel on different shards.
+    """
+
+    def __init__(self, handler, num_workers: int = 4, max_queue_size: int = 1000):
+        """
+        Args:
+            handler (callable): Function called with each queued Telegram update.
+            num_workers (int): Number of shards (one worker thread per shard).
+            max_queue_size (int): Maximum number of updates waiting over all shards.
+        """
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_queue_size = max_queue_size
+
+        shard_queue_size = max(1, max_queue_size // self.num_workers)
+        self._queues = [queue.Queue(maxsize=shard_queue_size) for _ in range(self.num_workers)]
+        self._shard_stats = [
+            {"processed": 0, "dropped": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for _ in range(self.num_workers)
+        ]
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the worker threads (only once)."""
+        with self._lock:
+            if self._workers:
+                return
+
+            for shard in range(self.num_workers):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    args=(shard,),
+                    name=f"update-worker-{shard}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+            logger.info(f"Update dispatcher started: shards={self.num_workers}, queue_size={self.max_queue_size}")
+
+    def shard_of(self, key: int) -> int:
+        """Returns the shard index of a key (chat ID)."""
+        return hash(key) % self.num_workers
+
+    def submit(self, update: dict, key: int) -> bool:
+        """
+        Queues an update on the shard of `key` without blocking.
+
+        Args:
+            update (dict): The Telegram update json.
+            key (int): The chat ID of the update, used to keep each user's updates in order.
+
+        Returns:
+            bool: True if the update is queued, False if the shard queue is full.
+        """
+        self.start()
+
+        shard = self.shard_of(key)
+        try:
+            self._queues[shard].put_nowait((time.monotonic(), update))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._shard_stats[shard]["dropped"] += 1
+            logger.warning(f"Update queue of shard {shard} is full, update dropped")
+            return False
+
+    def stats(self) -> list[dict]:
+        """
+        Returns the queue depth and wait time (time between queueing and processing) of each shard.
+
+        Example:
+            >>> dispatcher.stats()
+            >>> [{"shard": 0, "depth": 2, "processed": 120, "dropped": 0, "avg_wait_ms": 3.1, "max_wait_ms": 850.2}, ...]
+        """
+        with self._lock:
+            return [
+                {
+                    "shard": shard,
+                    "depth": self._queues[shard].qsize(),
+                    "processed": shard_stats["processed"],
+                    "dropped": shard_stats["dropped"],
+                    "avg_wait_ms": round(shard_stats["total_wait"] / shard_stats["processed"] * 1000, 3) if shard_stats["processed"] else 0.0,
+                    "max_wait_ms": round(shard_stats["max_wait"] * 1000, 3)
+                }
+                for shard, shard_stats in enumerate(self._shard_stats)
+            ]
+
+    def _worker_loop(self, shard: int) -> None:
+        shard_queue = self._queues[shard]
+        shard_stats = self._shard_stats[shard]
+
+        while True:
+            enqueued_at, update = shard_queue.get()
+            wait = time.monotonic() - enqueued_at
+
+            with self._lock:
+                shard_stats["processed"] += 1
+                shard_stats["total_wait"] += wait
+                shard_stats["max_wait"] = max(shard_stats["max_wait"], wait)
+
+            try:
+                self.handler(update)
+            except Exception:
+                logger.exception(f"Failed to process update in shard {shard}")
+            finally:
+                shard_queue.task_done()
+
+class UpdateDeduplicator:
+    """
+    Remembers the last `window_size` Telegram `update_id`s to reject redelivered updates.
+
+    The IDs are kept in a fixed size ring buffer with a map of ID -> ring slot for
+    O(1) lookups and removals; the oldest ID is forgotten when a new one is added to
+    a full buffer.
+    """
+
+    def __init__(self, window_size: int = 10000):
+        self.window_size = max(1, window_size)
+
+        self._ring = [None] * self.window_size
+        self._index = 0
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """
+        Checks an update ID and records it when it is new.
+
+        Args:
+            update_id (int): The `update_id` of the Telegram update.
+
+        Returns:
+            bool: True if the update ID is already in the window, otherwise False.
+
+        Example:
+            >>> deduplicator.is_duplicate(1001)
+            >>> False
+            >>> deduplicator.is_duplicate(1001)
+            >>> True
+        """
+        with self._lock:
+            if update_id in self._slots:
+                self.duplicates += 1
+                return True
+
+            oldest_id = self._ring[self._index]
+            if oldest_id is not None:
+                del self._slots[oldest_id]
+
+            self._ring[self._index] = update_id
+            self._slots[update_id] = self._index
+            self._index = (self._index + 1) % self.window_size
+
+            return False
+
+    def forget(self, update_id: int) -> None:
+        """Removes an update ID so that a redelivery of the update is accepted again (e.g. when it could not be queued)."""
+        with self._lock:
+            slot = self._slots.pop(update_id, None)
+            if slot is not None:
+                # Clear the slot too, otherwise overwriting it later would drop
+                # a newer copy of the ID while it is still in the window
+                self._ring[slot] = None
+
+class SharedUpdateDeduplicator:
+    """
+    `UpdateDeduplicator` for many worker processes: the received update IDs are markers
+    in the shared session backend, so an update redelivered to another worker is rejected too.
+
+    IDs are kept for `ttl` seconds. While the backend cannot be reached, updates are
+    checked against the IDs seen by this process only.
+    """
+
+    def __init__(self, backend, ttl: float = 86400, window_size: int = 10000):
+        """
+        Args:
+            backend (SessionBackend): The session backend shared by the workers.
+            ttl (float): Seconds an update ID is remembered.
+            window_size (int): Size of the in-process window used while the backend is unreachable.
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self._local = UpdateDeduplicator(window_size=window_size)
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Checks an update ID and records it when it is new (see `UpdateDeduplicator.is_duplicate`)."""
+        try:
+            # Already set if a worker received the update before
+            duplicate = not self.backend.add_marker(f"update:{update_id}", self.ttl)
+        except Exception:
+            logger.exception(f"Failed to check update_id={update_id} in the session backend")
+            duplicate = self._local.is_duplicate(update_id)
+
+        if duplicate:
+            with self._lock:
+                self.duplicates += 1
+        return duplicate
+
+    def forget(self, update_id: int) -> None:
+        """Removes an update ID so that a redelivery of the update is accepted again."""
+        self._local.forget(update_id)
+        try:
+            self.backend.remove_marker(f"update:{update_id}")
+        except Exception:
+            logger.exception(f"Failed to forget update_id={update_id} in the session backend")
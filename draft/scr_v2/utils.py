@@ -1,10 +1,13 @@
 import json
 import logging
 import functools
+from datetime import date
 from dateutil import parser
 
 from telegram_api import *
 from supabase_api import *
+from session_models import UserSession, SessionOption
+from conversation import conversation_states
 
 logger = logging.getLogger(f'flask_app.{__name__}')
 
@@ -93,25 +96,16 @@ def create_api_response(
     return json.dumps(response), http_status
 
 @log_function(logger)
-def user_settings_initialize(user_id: int, user_settings_dict: dict) -> dict:
-    """Initialize user settings for a new user."""
+def load_user_session(user_id: int) -> UserSession:
+    """Loads the bot session of a user, with the profile stored in the database (if registered)."""
     user_setting_database = get_user_info(user_id)
     if user_setting_database:
-        user_settings_dict[user_id] = {
-            "username": user_setting_database["username"],
-            "default_currency": user_setting_database["default_currency"],
-            "temp_transaction": None,
-            "option": None
-        }
+        return UserSession(
+            username=user_setting_database["username"],
+            default_currency=user_setting_database["default_currency"]
+        )
     else:
-        user_settings_dict[user_id] = {
-            "username": None,
-            "default_currency": None,
-            "temp_transaction": None,
-            "option": None
-        }
-    
-    return user_settings_dict
+        return UserSession()
 
 @log_function(logger)
 def stardardize_date(date_input:str):
@@ -155,7 +149,8 @@ class SettingManager:
         SendInlineKeyboardMessage(user_id, user_info_update_message, keyboard_setting)
         
     @staticmethod
-    def transaction_setting_keyboard(user_id, transaction_update_message):
+    def transaction_setting_keyboard(user_id, transaction_update_message, message_id=None):
+        """Shows the transaction card with its edit buttons, edited in place if the card message ID is known."""
         keyboard_setting = {
             "inline_keyboard": [
                 [
@@ -182,50 +177,60 @@ class SettingManager:
             ]
         }
 
-        SendInlineKeyboardMessage(user_id, transaction_update_message, keyboard_setting)
+        if message_id is not None:
+            return EditMessageText(user_id, message_id, transaction_update_message, keyboard_setting)
+
+        return SendInlineKeyboardMessage(user_id, transaction_update_message, keyboard_setting)
 
+    @conversation_states.on(SessionOption.REGISTER_USERNAME)
     @log_function(logger)
     def username_update(self):
         new_username = self.user_input
-        self.user_settings[self.user_id]["username"] = new_username
-        self.user_settings[self.user_id]["option"] = None
+        old_username = self.user_settings[self.user_id].username
+        self.user_settings[self.user_id].username = new_username
+        self.user_settings[self.user_id].option = None
         
         username_update_message = (
             f"<b>⚙️ Settings Updated</b>\n\n"
             f"Username: {new_username}\n"
-            f"Default Currency: {self.user_settings[self.user_id]['default_currency']}"
+            f"Default Currency: {self.user_settings[self.user_id].default_currency}"
         )
 
         SettingManager.user_info_setting_keyboard(self.user_id, username_update_message)
 
-        user_info_update(
+        profile_update_coalescer.submit(
             user_id=self.user_id,
-            username=new_username
+            fields={"username": new_username},
+            current={"username": old_username}
         )
 
         return self.user_settings
     
+    @conversation_states.on(SessionOption.REGISTER_CURRENCY)
     @log_function(logger)
     def currency_update(self):
         new_currency = self.user_input
-        self.user_settings[self.user_id]["currency"] = new_currency
-        self.user_settings[self.user_id]["option"] = None
+        old_currency = self.user_settings[self.user_id].default_currency
+        self.user_settings[self.user_id].default_currency = new_currency
+        self.user_settings[self.user_id].option = None
 
         currency_update_message = (
             f"<b>⚙️ Settings Updated</b>\n\n"
-            f"Username: {self.user_settings[self.user_id]['username']}\n"
+            f"Username: {self.user_settings[self.user_id].username}\n"
             f"Default Currency: {new_currency}"
         )
 
         SettingManager.user_info_setting_keyboard(self.user_id, currency_update_message)
 
-        user_info_update(
+        profile_update_coalescer.submit(
             user_id=self.user_id,
-            currency=new_currency
+            fields={"default_currency": new_currency},
+            current={"default_currency": old_currency}
         )
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_DATE)
     @log_function(logger)
     def trans_date_update(self):
         new_date = self.user_input
@@ -235,56 +240,58 @@ class SettingManager:
             SendMessage(self.user_id, f"Cannot identify the date format ({self.user_input}). Please input again!")
             return self.user_settings
 
-        self.user_settings[self.user_id]["temp_transaction"]["date"] = new_date
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].temp_transaction.date = new_date
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         date_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, date_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, date_update_message, self.user_settings[self.user_id].message_id)
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_CATEGORY_TYPE)
     @log_function(logger)
     def trans_category_type_update(self):
         new_category_type = self.user_input
-        self.user_settings[self.user_id]["temp_transaction"]["category_type"] = new_category_type
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].temp_transaction.category_type = new_category_type
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         category_type_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, category_type_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, category_type_update_message, self.user_settings[self.user_id].message_id)
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_CATEGORY_NAME)
     @log_function(logger)
     def trans_category_name_update(self):
         new_category_name = self.user_input
-        self.user_settings[self.user_id]["temp_transaction"]["category_name"] = new_category_name
+        self.user_settings[self.user_id].temp_transaction.category_name = new_category_name
 
-        category_type = self.user_settings[self.user_id]["temp_transaction"]["category_type"]
-        category_name = self.user_settings[self.user_id]["temp_transaction"]["category_name"]
+        category_type = self.user_settings[self.user_id].temp_transaction.category_type
+        category_name = self.user_settings[self.user_id].temp_transaction.category_name
 
         ########################
         # Validate category name
@@ -304,90 +311,181 @@ class SettingManager:
 
             return self.user_settings
 
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         category_name_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, category_name_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, category_name_update_message, self.user_settings[self.user_id].message_id)
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_DESCRIPTION)
     @log_function(logger)
     def trans_description_update(self):
         new_description = self.user_input
-        self.user_settings[self.user_id]["temp_transaction"]["description"] = new_description
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].temp_transaction.description = new_description
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         description_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, description_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, description_update_message, self.user_settings[self.user_id].message_id)
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_CURRENCY)
     @log_function(logger)
     def trans_currency_update(self):
         new_currency = self.user_input
-        self.user_settings[self.user_id]["temp_transaction"]["currency"] = new_currency
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].temp_transaction.currency = new_currency
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         currency_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, currency_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, currency_update_message, self.user_settings[self.user_id].message_id)
 
         return self.user_settings
 
+    @conversation_states.on(SessionOption.TRANSACTION_AMOUNT)
     @log_function(logger)
     def trans_amount_update(self):
         new_amount = self.user_input
-        self.user_settings[self.user_id]["temp_transaction"]["amount"] = new_amount
-        self.user_settings[self.user_id]["option"] = None
+        self.user_settings[self.user_id].temp_transaction.amount = new_amount
+        self.user_settings[self.user_id].option = None
 
-        temp_transaction = self.user_settings[self.user_id]["temp_transaction"]
+        temp_transaction = self.user_settings[self.user_id].temp_transaction
 
         amount_update_message = (
             f"<b>⚙️ Updated Transaction Result:</b>\n\n"
-            f"<b>User ID:</b> <code>{temp_transaction['user_id']}</code>\n"
-            f"<b>Date:</b> <code>{temp_transaction['date']}</code>\n"
-            f"<b>Category Type:</b> <code>{temp_transaction['category_type']}</code>\n"
-            f"<b>Category Name:</b> <code>{temp_transaction['category_name']}</code>\n"
-            f"<b>Description:</b> <code>{temp_transaction['description']}</code>\n"
-            f"<b>Currency:</b> <code>{temp_transaction['currency']}</code>\n"
-            f"<b>Amount:</b> <code>{temp_transaction['amount']}</code>"
+            f"<b>User ID:</b> <code>{temp_transaction.user_id}</code>\n"
+            f"<b>Date:</b> <code>{temp_transaction.date}</code>\n"
+            f"<b>Category Type:</b> <code>{temp_transaction.category_type}</code>\n"
+            f"<b>Category Name:</b> <code>{temp_transaction.category_name}</code>\n"
+            f"<b>Description:</b> <code>{temp_transaction.description}</code>\n"
+            f"<b>Currency:</b> <code>{temp_transaction.currency}</code>\n"
+            f"<b>Amount:</b> <code>{temp_transaction.amount}</code>"
         )
 
-        SettingManager.transaction_setting_keyboard(self.user_id, amount_update_message)
+        SettingManager.transaction_setting_keyboard(self.user_id, amount_update_message, self.user_settings[self.user_id].message_id)
+
+        return self.user_settings
+
+class SummaryManager:
+
+    @staticmethod
+    def parse_month(text: str) -> str:
+        """
+        Returns the month (YYYY-MM) at the start of `text`.
+
+        Raises:
+            ValueError: If `text` does not start with a valid YYYY-MM month.
+
+        Example:
+            >>> SummaryManager.parse_month("2025-07")
+            >>> '2025-07'
+        """
+        return date.fromisoformat(f"{text[:7]}-01").isoformat()[:7]
+
+    @staticmethod
+    def shift_month(month: str, offset: int) -> str:
+        """
+        Returns the month `offset` months after `month` (YYYY-MM).
+
+        Example:
+            >>> SummaryManager.shift_month("2025-01", -1)
+            >>> '2024-12'
+        """
+        year, month_number = int(month[:4]), int(month[5:7])
+        index = year * 12 + (month_number - 1) + offset
+        return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+    @staticmethod
+    def monthly_summary_message(summary: dict) -> str:
+        """Formats a monthly summary (see `get_monthly_summary`) as a Telegram HTML message."""
+        month_title = date.fromisoformat(summary["month"]).strftime("%B %Y")
+
+        if not summary["type_totals"]:
+            return (
+                f"<b>📅 Monthly Summary - {month_title}</b>\n\n"
+                "No transactions in this month."
+            )
+
+        # Income / expense per currency
+        totals = {}
+        for row in summary["type_totals"]:
+            totals.setdefault(row["currency"], {"Income": 0.0, "Expense": 0.0})[row["category_type"]] = float(row["amount"])
+
+        lines = [f"<b>📅 Monthly Summary - {month_title}</b>\n"]
+        for currency, total in sorted(totals.items()):
+            lines.append(
+                f"<b>Income:</b> <code>{currency} {total['Income']:,.2f}</code>\n"
+                f"<b>Expense:</b> <code>{currency} {total['Expense']:,.2f}</code>\n"
+                f"<b>Net:</b> <code>{currency} {total['Income'] - total['Expense']:,.2f}</code>\n"
+            )
+
+        for category_type in ("Expense", "Income"):
+            rows = [row for row in summary["category_totals"] if row["category_type"] == category_type]
+            if not rows:
+                continue
+
+            lines.append(f"<b>{category_type} by Category:</b>")
+            for row in rows:
+                lines.append(f"•  {row['category_name']}: <code>{row['currency']} {float(row['amount']):,.2f}</code> ({row['count']})")
+            lines.append("")
+
+        return "\n".join(lines).strip()
+
+    @staticmethod
+    def monthly_summary_keyboard(user_id, month, message_id=None):
+        """Shows the summary of `month` (YYYY-MM) with month navigation buttons, edited in place if the message ID is known."""
+        summary = get_monthly_summary(user_id, month)
+        monthly_summary_message = SummaryManager.monthly_summary_message(summary)
+
+        keyboard_setting = {
+            "inline_keyboard": [
+                [
+                    {"text": "◀️ Previous", "callback_data": f"SUMMARY_{SummaryManager.shift_month(month, -1)}"},
+                    {"text": "Next ▶️", "callback_data": f"SUMMARY_{SummaryManager.shift_month(month, 1)}"}
+                ],
+                [
+                    {"text": "Open Dashboard", "url": f"http://18.141.159.254:8501/?user_id={user_id}"}
+                ]
+            ]
+        }
+
+        if message_id is not None:
+            return EditMessageText(user_id, message_id, monthly_summary_message, keyboard_setting)
 
-        return self.user_settings
\ No newline at end of file
+        return SendInlineKeyboardMessage(user_id, monthly_summary_message, keyboard_setting)
@@ -0,0 +1,526 @@
+import os
+import re
+import glob
+import json
+import time
+import uuid
+import logging
+import threading
+
+logger = logging.getLogger(f'flask_app.{__name__}')
+
+class TransactionWriteBuffer:
+    """
+    Write-behind buffer for saved transactions.
+
+    `add` appends the transaction to an append-only spool file (so it survives a crash)
+    and returns a pending ID at once. A background thread flushes the buffered
+    transactions as one multi-row insert when `max_batch_size` rows are waiting or
+    every `flush_interval` seconds.
+
+    Every process writes its own spool file `<spool_path>.<pid>`, so worker processes
+    never overwrite each other's rows. The spool files of processes that are gone
+    (e.g., after a crash) are claimed with an atomic rename by one live process, at its
+    start and then every `recover_interval` seconds, and their rows are flushed by it.
+
+    Rows are given to `insert_rows` with their `pending_id`, which `insert_rows` must
+    store in a unique column and skip when it is already stored: a flush repeated after
+    a crash (or after a lost response) then cannot insert a transaction twice.
+
+    When the database is unreachable the rows stay in the spool and the flush is
+    retried with exponential backoff. Only rows the database rejects as invalid
+    (see `is_rejected`) are moved to the `<spool_path>.failed` dead-letter file,
+    from where `replay_failed` inserts them again.
+    """
+
+    def __init__(
+        self,
+        insert_rows,
+        spool_path: str,
+        max_batch_size: int = 50,
+        flush_interval: float = 2.0,
+        max_backoff: float = 60.0,
+        recover_interval: float = 60.0,
+        is_rejected=None,
+        on_flush=None
+    ):
+        """
+        Args:
+            insert_rows (callable): Function that inserts a list of transactions in one request,
+                ignoring the rows whose `pending_id` is already stored.
+            spool_path (str): Base path of the spool files (`<spool_path>.<pid>` per process).
+            max_batch_size (int): Number of waiting rows that triggers a flush.
+            flush_interval (float): Maximum seconds a row waits before it is flushed.
+            max_backoff (float): Maximum seconds between the retries of a failing flush.
+            recover_interval (float): Seconds between two checks for spool files left by other processes.
+            is_rejected (callable, optional): Called with the exception of a failed insert, returns True
+                if the database rejected the rows themselves (bad data, constraint), False for an outage.
+                Every failure is treated as an outage if None.
+            on_flush (callable, optional): Called with the list of inserted transactions after each flush
+                (e.g., to invalidate caches of the saved data).
+        """
+        self.insert_rows = insert_rows
+        self.spool_path = spool_path
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.recover_interval = recover_interval
+        self.is_rejected = is_rejected
+        self.on_flush = on_flush
+        self._failures_in_row = 0
+        self._retry_at = 0.0
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._own_spool_path = None
+        self._recovered_at = 0.0
+
+        self.flush_count = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dead_lettered_rows = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+    def start(self) -> int:
+        """
+        Recovers the rows left in spool files and starts the flusher thread (once per process).
+
+        Returns:
+            int: The number of recovered rows (0 if already started).
+        """
+        with self._lock:
+            # A forked worker has no flusher thread and needs its own spool file
+            if self._thread is not None and self._pid == os.getpid():
+                return 0
+
+            self._pid = os.getpid()
+            self._own_spool_path = f"{self.spool_path}.{self._pid}"
+            recovered = self._recover()
+
+            self._thread = threading.Thread(target=self._flush_loop, name="transaction-write-buffer", daemon=True)
+            self._thread.start()
+            return recovered
+
+    def recover(self) -> int:
+        """
+        Takes over the rows of the spool files left by processes that are gone.
+
+        Returns:
+            int: The number of recovered rows.
+        """
+        recovered = self.start()
+        with self._lock:
+            return recovered + self._recover()
+
+    def add(self, transaction: dict) -> str:
+        """
+        Buffers a transaction to be inserted.
+
+        Args:
+            transaction (dict): The transaction to insert.
+
+        Returns:
+            str: The pending ID of the transaction.
+
+        Example:
+            >>> transaction_write_buffer.add({"user_id": 1, "date": "2025-07-01", "category_id": 16, ...})
+            >>> '3f2b9c0e5d7a4e1b'
+        """
+        self.start()
+
+        pending_id = uuid.uuid4().hex[:16]
+        entry = {"pending_id": pending_id, "row": transaction}
+
+        with self._lock:
+            with open(self._own_spool_path, "a", encoding="utf-8") as spool:
+                spool.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+
+            self._pending.append(entry)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush_event.set()
+
+        return pending_id
+
+    def flush(self) -> int:
+        """
+        Inserts all buffered transactions in one request.
+
+        Returns:
+            int: The number of inserted rows (0 if the insert failed, the rows are retried later).
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self, pending_ids: set = None) -> int:
+        """Inserts the buffered transactions (only those in `pending_ids` if given), `_flush_lock` must be held."""
+        with self._lock:
+            if pending_ids is None:
+                batch = self._pending
+                self._pending = []
+            else:
+                batch = [entry for entry in self._pending if entry["pending_id"] in pending_ids]
+                self._pending = [entry for entry in self._pending if entry["pending_id"] not in pending_ids]
+
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            self.insert_rows([self._row(entry) for entry in batch])
+            inserted, retry = batch, []
+        except Exception as e:
+            if not self._is_rejected(e):
+                self._retry_later(batch, f"Failed to flush {len(batch)} buffered transactions")
+                return 0
+
+            # Some rows are invalid, insert the rows one by one so they do not block the others
+            inserted, retry = self._isolate_failed_rows(batch)
+
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            self._pending = retry + self._pending
+            # Keep only the rows not inserted yet in the spool file
+            self._write_spool(self._pending)
+
+            if not retry:
+                self._failures_in_row = 0
+                self._retry_at = 0.0
+            if inserted:
+                self.flush_count += 1
+                self.flushed_rows += len(inserted)
+                self.last_flush_latency = latency
+                self.max_flush_latency = max(self.max_flush_latency, latency)
+                self._total_flush_latency += latency
+
+        if self.on_flush is not None and inserted:
+            try:
+                self.on_flush([self._row(entry) for entry in inserted])
+            except Exception:
+                logger.exception("on_flush callback failed")
+
+        return len(inserted)
+
+    def replay_failed(self) -> dict:
+        """
+        Inserts the dead-lettered rows again (e.g., after the data or the schema was fixed).
+        Rows still rejected go back to the dead-letter file, rows not inserted because
+        of an outage stay in the buffer and are retried later.
+
+        Returns:
+            dict: The number of rows taken from the dead-letter file ("replayed") and how many of them were inserted ("inserted").
+
+        Example:
+            >>> buffer.replay_failed()
+            >>> {'replayed': 3, 'inserted': 2}
+        """
+        self.start()
+
+        failed_path = f"{self.spool_path}.failed"
+        # Claim the file first, rows dead-lettered meanwhile go to a new file
+        claimed_path = f"{failed_path}.{os.getpid()}.replay"
+        try:
+            os.replace(failed_path, claimed_path)
+        except FileNotFoundError:
+            return {"replayed": 0, "inserted": 0}
+
+        entries = self._read_spool(claimed_path)
+        logger.info(f"Replaying {len(entries)} dead-lettered transactions from {failed_path}")
+
+        # Held until the replayed rows are flushed, so the background flush cannot insert them in between
+        with self._flush_lock:
+            with self._lock:
+                self._pending.extend(entries)
+                self._write_spool(self._pending)
+            os.remove(claimed_path)
+
+            # Only the replayed rows, the other buffered rows are flushed as usual
+            inserted = self._flush({entry["pending_id"] for entry in entries})
+
+        return {"replayed": len(entries), "inserted": inserted}
+
+    def failed_entries(self) -> list[dict]:
+        """Returns the entries ({"pending_id": ..., "row": {...}}) in the dead-letter file."""
+        return self._read_spool(f"{self.spool_path}.failed")
+
+    def stats(self) -> dict:
+        """Returns the number of pending rows and the flush counters and latency."""
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "flush_count": self.flush_count,
+                "flushed_rows": self.flushed_rows,
+                "failed_flushes": self.failed_flushes,
+                "dead_lettered_rows": self.dead_lettered_rows,
+                "retry_in_s": round(max(self._retry_at - time.monotonic(), 0.0), 3),
+                "last_flush_latency_ms": round(self.last_flush_latency * 1000, 3),
+                "avg_flush_latency_ms": round(self._total_flush_latency / self.flush_count * 1000, 3) if self.flush_count else 0.0,
+                "max_flush_latency_ms": round(self.max_flush_latency * 1000, 3)
+            }
+
+    @staticmethod
+    def _row(entry: dict) -> dict:
+        return {**entry["row"], "pending_id": entry["pending_id"]}
+
+    def _is_rejected(self, error: Exception) -> bool:
+        return self.is_rejected is not None and self.is_rejected(error)
+
+    def _retry_later(self, batch: list[dict], message: str) -> None:
+        """Puts the rows back in front of the buffer and backs off exponentially (the spool still holds them)."""
+        with self._lock:
+            self._pending = batch + self._pending
+            self._failures_in_row += 1
+            self.failed_flushes += 1
+            delay = min(self.flush_interval * 2 ** (self._failures_in_row - 1), self.max_backoff)
+            self._retry_at = time.monotonic() + delay
+
+        logger.exception(f"{message}, retry in {delay:.1f}s")
+
+    def _isolate_failed_rows(self, batch: list[dict]) -> tuple[list[dict], list[dict]]:
+        """
+        Inserts the rows one by one and moves the rejected rows to the dead-letter file.
+
+        Returns:
+            tuple[list[dict], list[dict]]: The inserted rows and the rows to retry (failed by an outage).
+        """
+        inserted, rejected, retry = [], [], []
+        for index, entry in enumerate(batch):
+            try:
+                self.insert_rows([self._row(entry)])
+                inserted.append(entry)
+            except Exception as e:
+                if not self._is_rejected(e):
+                    # The database went away, keep this row and the rest for the next flush
+                    retry = batch[index:]
+                    self._retry_later([], f"Failed to insert buffered transaction {entry['pending_id']}")
+                    break
+                logger.error(f"Transaction {entry['pending_id']} rejected by the database: {e}")
+                rejected.append(entry)
+
+        if rejected:
+            logger.error(f"Moved {len(rejected)} transactions that cannot be inserted to {self.spool_path}.failed")
+            # Shared by the processes, one write per batch keeps the appended lines whole
+            with open(f"{self.spool_path}.failed", "a", encoding="utf-8") as dead_letter:
+                dead_letter.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in rejected))
+                dead_letter.flush()
+                os.fsync(dead_letter.fileno())
+            with self._lock:
+                self.dead_lettered_rows += len(rejected)
+
+        return inserted, retry
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._flush_event.wait(timeout=self.flush_interval)
+            self._flush_event.clear()
+            if time.monotonic() - self._recovered_at >= self.recover_interval:
+                try:
+                    self.recover()
+                except Exception:
+                    logger.exception("Failed to recover the spool files of other processes")
+            if time.monotonic() < self._retry_at:
+                # Backing off after a failed flush
+                continue
+            self.flush()
+
+    def _recover(self) -> int:
+        """Claims the orphaned spool files, merges their rows into the buffer and the own spool file (lock held)."""
+        self._recovered_at = time.monotonic()
+
+        claimed = []
+        for path in self._orphaned_spools():
+            if path.startswith(f"{self._own_spool_path}.recovering."):
+                claimed.append(path)
+                continue
+            # Atomic: when processes recover at the same time only one of them gets each file
+            claimed_path = f"{self._own_spool_path}.recovering.{uuid.uuid4().hex[:8]}"
+            try:
+                os.replace(path, claimed_path)
+            except FileNotFoundError:
+                continue
+            claimed.append(claimed_path)
+
+        # The own spool file is left by an earlier process with the same PID (e.g., a restarted container)
+        seen = {entry["pending_id"] for entry in self._pending}
+        recovered = []
+        for path in [self._own_spool_path, *claimed]:
+            for entry in self._read_spool(path):
+                # A crash after the merge but before the claimed files were removed leaves the rows twice
+                if entry["pending_id"] not in seen:
+                    seen.add(entry["pending_id"])
+                    recovered.append(entry)
+
+        if not recovered and not claimed:
+            return 0
+
+        self._pending = recovered + self._pending
+        self._write_spool(self._pending)
+        for path in claimed:
+            os.remove(path)
+
+        if recovered:
+            logger.info(f"Recovered {len(recovered)} buffered transactions from {len(claimed)} spool files of other processes")
+            self._flush_event.set()
+        return len(recovered)
+
+    def _orphaned_spools(self) -> list[str]:
+        """Returns the spool files of processes that are gone (and the old single spool file)."""
+        pattern = re.compile(rf"{re.escape(self.spool_path)}\.(\d+)(\.recovering\.\w+)?")
+
+        paths = [self.spool_path] if os.path.exists(self.spool_path) else []
+        for path in glob.glob(f"{glob.escape(self.spool_path)}.*"):
+            match = pattern.fullmatch(path)
+            if match is None or path == self._own_spool_path:
+                continue
+            pid = int(match.group(1))
+            if pid == self._pid or not self._is_alive(pid):
+                paths.append(path)
+        return paths
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        if os.name != "posix":
+            # No signal 0 check, only the files of this process are recovered
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _read_spool(self, path: str) -> list[dict]:
+        if not os.path.exists(path):
+            return []
+
+        entries = []
+        with open(path, encoding="utf-8") as spool:
+            for line in spool:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A line cut by a crash while it was written
+                    logger.warning(f"Skipped a broken line in {path}")
+        return entries
+
+    def _write_spool(self, entries: list[dict]) -> None:
+        temp_path = f"{self._own_spool_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as spool:
+            for entry in entries:
+                spool.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+        os.replace(temp_path, self._own_spool_path)
+
+class ProfileUpdateCoalescer:
+    """
+    Coalesces the profile updates of a user into one write.
+
+    The first changed field of a user starts a `window` seconds timer; all fields
+    changed by the user until the timer fires are merged and written with one
+    request. Fields set back to their value before the window are not written,
+    and nothing is written if no field changed.
+    """
+
+    def __init__(self, update_fields, window: float = 1.0):
+        """
+        Args:
+            update_fields (callable): Function called as update_fields(user_id, fields) that writes the fields in one request.
+            window (float): Seconds the edits of a user are collected before they are written.
+        """
+        self.update_fields = update_fields
+        self.window = window
+
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self.writes = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    def submit(self, user_id: int, fields: dict, current: dict = None) -> None:
+        """
+        Queues changed profile fields of a user.
+
+        Args:
+            user_id (int): The user's unique identifier.
+            fields (dict): The new values by column name (e.g., {"username": "john_doe"}).
+            current (dict, optional): The values stored in the database before the change.
+
+        Example:
+            >>> profile_update_coalescer.submit(123456789, {"default_currency": "HKD"}, {"default_currency": "USD"})
+        """
+        current = current or {}
+
+        with self._lock:
+            pending = self._pending.get(user_id)
+
+            if pending is not None:
+                # Merge into the write already waiting for this user
+                pending["fields"].update(fields)
+                for field in fields:
+                    pending["current"].setdefault(field, current.get(field))
+                self.coalesced += 1
+                return
+
+            if all(field in current and current[field] == value for field, value in fields.items()):
+                self.skipped += 1
+                return
+
+            self._pending[user_id] = {"fields": dict(fields), "current": {field: current.get(field) for field in fields}}
+
+        timer = threading.Timer(self.window, self.flush_user, args=(user_id,))
+        timer.daemon = True
+        timer.start()
+
+    def flush_user(self, user_id: int) -> None:
+        """Writes the pending fields of a user now."""
+        with self._lock:
+            pending = self._pending.pop(user_id, None)
+
+        if pending is None:
+            return
+
+        fields = {
+            field: value
+            for field, value in pending["fields"].items()
+            if pending["current"].get(field) != value
+        }
+        if not fields:
+            with self._lock:
+                self.skipped += 1
+            return
+
+        try:
+            self.update_fields(user_id, fields)
+            with self._lock:
+                self.writes += 1
+        except Exception:
+            logger.exception(f"Failed to update the profile of user {user_id}: {fields}")
+
+    def flush_all(self) -> None:
+        """Writes the pending fields of all users now (e.g., before shutdown)."""
+        with self._lock:
+            user_ids = list(self._pending)
+
+        for user_id in user_ids:
+            self.flush_user(user_id)
+
+    def stats(self) -> dict:
+        """Returns the number of users with pending fields and the write / coalesced / skipped counters."""
+        with self._lock:
+            return {
+                "pending_users": len(self._pending),
+                "writes": self.writes,
+                "coalesced": self.coalesced,
+                "skipped": self.skipped
+            }
@@ -0,0 +1,49 @@
+"""
+Inspects and replays the transactions of the write-behind buffer.
+
+Rows the database rejected as invalid are moved to the dead-letter file
+`<WRITE_BUFFER_SPOOL_PATH>.failed`. After fixing the cause (e.g., a missing category
+or a schema change), `replay` inserts them again; rows still rejected go back to the
+dead-letter file.
+
+Usage:
+    python write_buffer_tool.py status
+    python write_buffer_tool.py replay
+"""
+import sys
+import argparse
+
+import config
+from write_behind import TransactionWriteBuffer
+from supabase_api import *
+
+def status(buffer: TransactionWriteBuffer) -> int:
+    """Prints the number of dead-lettered rows and returns it."""
+    failed = buffer.failed_entries()
+    print(f"{len(failed)} dead-lettered transactions in {buffer.spool_path}.failed")
+    return len(failed)
+
+def replay(buffer: TransactionWriteBuffer) -> int:
+    """Inserts the dead-lettered rows again. Returns the number of rows not inserted."""
+    result = buffer.replay_failed()
+    not_inserted = result["replayed"] - result["inserted"]
+    print(f"Replayed {result['replayed']} transactions: {result['inserted']} inserted, {not_inserted} not inserted")
+    return not_inserted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay the dead-lettered transactions of the write buffer.")
+    parser.add_argument("action", choices=["status", "replay"])
+    args = parser.parse_args()
+
+    buffer = TransactionWriteBuffer(
+        insert_rows=transactions_bulk_insert,
+        spool_path=config.WRITE_BUFFER_SPOOL_PATH,
+        is_rejected=is_rejected_row_error
+    )
+
+    if args.action == "status":
+        remaining = status(buffer)
+    else:
+        remaining = replay(buffer)
+
+    sys.exit(1 if remaining else 0)